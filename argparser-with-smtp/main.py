@@ -1,19 +1,20 @@
 import argparse
-import smtplib
-import ssl
 import sys
 import re
 import random
 import logging
-import requests
-import bs4
+import queue
+import time
 from datetime import datetime
 from email.message import EmailMessage
-from email.utils import formataddr
+from email.utils import formataddr, parseaddr
 
 ENCODING = 'utf-8'
 CONFIG_FILE_PATH = 'env.config'
 CONFIG = {}
+BULK_WORKERS = 4
+BULK_RETRIES = 3
+RETRY_DELAY = 0.5
 
 config_header_pattern = re.compile('\[(\w+)\]\s*')
 config_body_pattern = re.compile('(\w+)\=(.*)')
@@ -26,47 +27,206 @@ def run():
         description='A mail processing / web scrapping app')
     parser.add_argument(
         '-m', '--mail', help='a message to be sent via e-mail', nargs='*')
+    parser.add_argument(
+        '-b', '--bulk', help='a message to be sent to many recipients', nargs='*')
+    parser.add_argument('--to', nargs='+', default=[],
+                        help='recipients of the bulk message')
+    parser.add_argument('--to-file',
+                        help='file with a recipient of the bulk message per line')
+    parser.add_argument('-w', '--workers', type=int, default=BULK_WORKERS,
+                        help='number of SMTP connections used in parallel')
+    parser.add_argument('--retries', type=int, default=BULK_RETRIES,
+                        help='retries of a recipient after a temporary failure')
+    parser.add_argument('-c', '--config', default=CONFIG_FILE_PATH,
+                        help='file with the [Config] section')
     parser.add_argument('-pn', '--poke-names',
                         help='print the specified number of pokemon names')
     parser.add_argument(
         '-r', '--researchers', help='print the list of researchers starting with the specified letter')
     args = parser.parse_args()
-    process_config(load_file_lines(CONFIG_FILE_PATH, ENCODING))
+    if args.bulk is not None and not (args.to or args.to_file):
+        parser.error('the bulk message needs --to or --to-file')
+    process_config(load_file_lines(args.config, ENCODING))
     timestamp = f'{datetime.now().strftime("%d-%m-%Y-%H_%M_%S")}'
     # send email
     if args.mail:
         send_mail(f'{timestamp}\t{args.mail[0]}')
     elif args.mail is not None:
         send_mail(timestamp)
+    if args.bulk is not None:
+        text = f'{timestamp}\t{args.bulk[0]}' if args.bulk else timestamp
+        recipients = load_recipients(args.to, args.to_file)
+        send_bulk(text, recipients, args.workers, args.retries)
     if args.researchers:
         print_researchers(args.researchers)
     if args.poke_names:
         print_pokemon_names(int(args.poke_names))
 
 
-def send_mail(message):
+def make_message(message, recipient):
     msg = EmailMessage()
     msg.set_content(message)
     msg['From'] = formataddr(('Artem Popelyshev', CONFIG['user']))
-    msg['To'] = CONFIG['recipient_mail']
+    msg['To'] = recipient
     msg['Subject'] = 'Test Message Header'
-    context = ssl.create_default_context()
+    return msg
+
+
+# STARTTLS can be turned off with starttls=no and the login is skipped when
+# no password is configured, which is what a local stand-in server needs
+def open_smtp():
+    import smtplib
+    import ssl
+
+    server = smtplib.SMTP(CONFIG['smtp_server'], int(CONFIG['port']), timeout=30)
     try:
-        with smtplib.SMTP(CONFIG['smtp_server'], int(CONFIG['port'])) as server:
-            server.starttls(context=context)
+        if CONFIG.get('starttls', 'yes') != 'no':
+            server.starttls(context=ssl.create_default_context())
+        if CONFIG.get('password'):
             server.login(CONFIG['user'], CONFIG['password'])
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+def send_mail(message):
+    import smtplib
+
+    msg = make_message(message, CONFIG['recipient_mail'])
+    try:
+        with open_smtp() as server:
             dict = server.sendmail(
                 CONFIG['user'], CONFIG['recipient_mail'], msg.as_string())
             if not dict:
                 print('Message sent successfully!')
-    except smtplib.SMTPException as e:
+    except (smtplib.SMTPException, OSError) as e:
         print('A problem occured while sending your message - check logs!')
         logging.error(str(e))
 
+
+# Recipients may carry a display name, duplicates are found by the bare address
+def load_recipients(addresses, path=None):
+    if path:
+        addresses = addresses + load_file_lines(path, ENCODING)
+    recipients = {}
+    for line in addresses:
+        if not line or line.startswith('#'):
+            continue
+        name, address = parseaddr(line)
+        recipients.setdefault(address, formataddr((name, address)))
+    return list(recipients.values())
+
+
+# Authenticated connections are handed out to the sending threads and put
+# back after every message, so each one is set up only once per bulk run
+class SMTPPool:
+    def __init__(self, connect):
+        self.connect = connect
+        self.idle = queue.Queue()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, server):
+        self.idle.put(server)
+
+    def discard(self, server):
+        try:
+            server.close()
+        except OSError:
+            pass
+
+    def close(self):
+        while not self.idle.empty():
+            server = self.idle.get_nowait()
+            try:
+                server.quit()
+            except Exception:
+                self.discard(server)
+
+
+def is_temporary(code):
+    return 400 <= code < 500
+
+
+# Temporary failures (4xx replies, dropped connections) are retried with an
+# exponential backoff, permanent ones are raised right away; returns the
+# number of retries that were needed
+def send_bulk_message(pool, message, recipient, retries):
+    import smtplib
+
+    for attempt in range(retries + 1):
+        server = None
+        try:
+            server = pool.acquire()
+            server.send_message(make_message(message, recipient))
+            pool.release(server)
+            return attempt
+        except smtplib.SMTPRecipientsRefused as e:
+            pool.release(server)
+            error = e
+            if not is_temporary(next(iter(e.recipients.values()))[0]):
+                raise
+        except smtplib.SMTPResponseException as e:
+            if server:
+                pool.discard(server)
+            error = e
+            if not is_temporary(e.smtp_code):
+                raise
+        except (smtplib.SMTPServerDisconnected, OSError) as e:
+            if server:
+                pool.discard(server)
+            error = e
+        if attempt < retries:
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(1, 1.5))
+    raise error
+
+
+def send_bulk(message, recipients, workers=BULK_WORKERS, retries=BULK_RETRIES):
+    import smtplib
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    pool = SMTPPool(open_smtp)
+    sent = retried = 0
+    failed = []
+    started = time.perf_counter()
+    try:
+        pool.release(open_smtp())
+    except (smtplib.SMTPException, OSError) as e:
+        print('A problem occured while connecting to the SMTP server - check logs!')
+        logging.error(str(e))
+        return list(recipients)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(send_bulk_message, pool, message, r, retries): r
+                       for r in recipients}
+            for future in as_completed(futures):
+                try:
+                    retried += future.result()
+                    sent += 1
+                except Exception as e:
+                    failed.append(futures[future])
+                    logging.error(f'{futures[future]}: {e!r}')
+    finally:
+        pool.close()
+    elapsed = time.perf_counter() - started
+    print(f'Sent {sent} of {len(recipients)} messages in {elapsed:.2f}s '
+          f'({sent / elapsed:.1f} messages/s, {retried} retries)')
+    if failed:
+        print(f'Failed for {len(failed)} recipients - check logs!')
+    return failed
+
+
 # Changed to requesting Pokemon names cause the Cats API was broken
 
 
 def print_pokemon_names(num):
+    import requests
+
     print('Random pokemon names:')
     response = requests.get(
         f'https://pokeapi.co/api/v2/pokemon/?offset={random.randint(0, 1100-num)}&limit={num}')
@@ -75,7 +235,12 @@ def print_pokemon_names(num):
         print(f'#{k+1} - {facts[k]["name"]}')
 
 
+# smtplib, requests and bs4 are imported only by the options that use them,
+# so --help and the other options start fast
 def print_researchers(letter):
+    import bs4
+    import requests
+
     page = requests.get('https://wiz.pwr.edu.pl/pracownicy?letter=' + letter)
     page.raise_for_status()
 
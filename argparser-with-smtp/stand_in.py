@@ -0,0 +1,124 @@
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+PORT = 8025
+STAND_IN_CONFIG = '''[Config]
+user=reports@localhost
+smtp_server=127.0.0.1
+port={port}
+starttls=no
+recipient_mail=someone@localhost
+'''
+
+
+# Speaks just enough SMTP for smtplib: no TLS, no AUTH, messages are counted
+# and dropped. Some recipients can be refused with a temporary 451 or, for a
+# rejected domain, with a permanent 550 to exercise the retries
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        self.server.count('connections')
+        self.reply('220 stand-in ESMTP ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-stand-in\r\n250 8BITMIME\r\n')
+            elif verb in ('HELO', 'NOOP'):
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.partition(':')[2].strip().strip('<>')
+                status = self.server.check_recipient(address)
+                if status == 250:
+                    recipients.append(address)
+                    self.reply('250 OK')
+                elif status == 451:
+                    self.reply('451 4.3.0 Try again later')
+                else:
+                    self.reply('550 5.1.1 No such user')
+            elif verb == 'DATA':
+                if not recipients:
+                    self.reply('503 5.5.1 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                time.sleep(self.server.delay)
+                self.server.count('messages', len(recipients))
+                recipients = []
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 5.5.2 Command not implemented')
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port, fail_rate=0.0, reject_domain=None, delay=0.0, seed=0):
+        super().__init__(('127.0.0.1', port), SMTPHandler)
+        self.fail_rate = fail_rate
+        self.reject_domain = reject_domain
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.totals = {'connections': 0, 'messages': 0, 'deferred': 0, 'rejected': 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.totals[key] += amount
+
+    def check_recipient(self, address):
+        if self.reject_domain and address.endswith('@' + self.reject_domain):
+            self.count('rejected')
+            return 550
+        with self.lock:
+            deferred = self.random.random() < self.fail_rate
+        if deferred:
+            self.count('deferred')
+            return 451
+        return 250
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Serves a local SMTP stand-in for testing the bulk mail mode')
+    parser.add_argument('-p', '--port', type=int, default=PORT)
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='share of recipients refused with a temporary 451')
+    parser.add_argument('--reject-domain',
+                        help='recipients of this domain are refused with a permanent 550')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='seconds spent on every message, like a remote server')
+    parser.add_argument('--write-config', metavar='PATH',
+                        help='write a config for main.py pointing at the stand-in')
+    args = parser.parse_args()
+    if args.write_config:
+        with open(args.write_config, 'w', encoding='utf-8') as stream:
+            stream.write(STAND_IN_CONFIG.format(port=args.port))
+    with StandInServer(args.port, args.fail_rate, args.reject_domain, args.delay) as server:
+        print(f'SMTP stand-in listening at 127.0.0.1:{args.port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        print(', '.join(f'{k}: {v}' for k, v in server.totals.items()))
+
+
+if __name__ == '__main__':
+    run()
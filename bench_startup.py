@@ -0,0 +1,79 @@
+from statistics import median
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# name: (directory, module imported on start, budget in ms)
+TARGETS = {
+    'gui': ('gui-app-api-database', 'app', 100),
+    'cli': ('argparser-with-smtp', 'main', 80),
+}
+RUNS = 5
+import_line_pattern = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+# Every run is a fresh interpreter started outside the app directory, so
+# nothing the module writes on import ends up in the repo. Only the imports
+# done by the module count, the interpreter's own site imports do not
+def measure_import(directory, module):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (directory, env.get('PYTHONPATH'))))
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    children = []
+    for line in result.stderr.splitlines():
+        match = import_line_pattern.match(line)
+        if match is None:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if depth == 1 and name == module:
+            return cumulative / 1000, children
+        if depth == 3:
+            children.append((cumulative / 1000, name))
+        elif depth == 1:
+            children.clear()
+    raise ValueError(f'No import time was reported for {module}')
+
+
+def bench_target(name, runs, budget, top):
+    directory, module, default_budget = TARGETS[name]
+    budget = budget or default_budget
+    measure_import(os.path.join(ROOT, directory), module)
+    timings = []
+    for _ in range(runs):
+        elapsed, children = measure_import(os.path.join(ROOT, directory), module)
+        timings.append(elapsed)
+    took = median(timings)
+    verdict = 'ok' if took <= budget else 'OVER BUDGET'
+    print(f'{name}: import {module} took {took:.1f} ms (median of {runs}), '
+          f'budget {budget} ms - {verdict}')
+    for elapsed, child in sorted(children, reverse=True)[:top]:
+        print(f'    {elapsed:8.1f} ms  {child}')
+    return took <= budget
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Fails when the cold-start import time of the apps exceeds a budget')
+    parser.add_argument('--apps', nargs='*', choices=TARGETS,
+                        help='apps to measure (default: all)')
+    parser.add_argument('-n', '--runs', type=int, default=RUNS,
+                        help='fresh interpreters started per app')
+    parser.add_argument('-b', '--budget', type=float,
+                        help='budget in ms for every measured app')
+    parser.add_argument('-t', '--top', type=int, default=0,
+                        help='list the N slowest imports done by each app')
+    args = parser.parse_args()
+    results = [bench_target(name, args.runs, args.budget, args.top)
+               for name in args.apps or TARGETS]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,124 @@
+import csv
+from array import array
+
+import numpy as np
+
+SNIFF_SIZE = 1024
+NUMERIC_FIELDS = ('Aboard', 'Fatalities', 'Ground')
+CATEGORY_FIELDS = {'operator': 'Operator', 'type': 'Type', 'location': 'Location'}
+GROUP_KEYS = ('year', 'decade', 'operator', 'type', 'location')
+DEFAULT_GROUP_BY = [('decade',)]
+
+
+class CrashColumns:
+    def __init__(self, years, numbers, nulls, codes, categories):
+        self.years = years
+        self.numbers = numbers
+        self.nulls = nulls
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.years)
+
+    def filled(self, field):
+        return np.where(self.nulls[field], 0, self.numbers[field])
+
+    def key_column(self, key):
+        if key == 'year':
+            return self.years
+        if key == 'decade':
+            return self.years // 10 * 10
+        return self.codes[key]
+
+    def key_label(self, key, value):
+        if key == 'decade':
+            return f'{value} - {value + 10}'
+        if key == 'year':
+            return str(value)
+        return self.categories[key][value]
+
+
+# Numbers are parsed once into typed arrays with a null mask, the text
+# columns used for grouping are dictionary-encoded
+def load_columns(filename):
+    years = array('h')
+    numbers = {f: array('q') for f in NUMERIC_FIELDS}
+    nulls = {f: array('b') for f in NUMERIC_FIELDS}
+    codes = {k: array('i') for k in CATEGORY_FIELDS}
+    lookups = {k: {} for k in CATEGORY_FIELDS}
+    with open(filename) as datafile:
+        dialect = csv.Sniffer().sniff(datafile.read(SNIFF_SIZE))
+        datafile.seek(0)
+        for row in csv.DictReader(datafile, dialect=dialect):
+            date = row['Date']
+            years.append(int(date[-4:]))
+            for field in NUMERIC_FIELDS:
+                value = row[field]
+                nulls[field].append(not value)
+                numbers[field].append(int(value) if value else 0)
+            for key, field in CATEGORY_FIELDS.items():
+                lookup = lookups[key]
+                codes[key].append(lookup.setdefault(row[field], len(lookup)))
+    return CrashColumns(
+        np.frombuffer(years, dtype=np.int16).astype(np.int64),
+        {f: np.frombuffer(a, dtype=np.int64) for f, a in numbers.items()},
+        {f: np.frombuffer(a, dtype=np.int8).astype(bool) for f, a in nulls.items()},
+        {k: np.frombuffer(a, dtype=np.int32) for k, a in codes.items()},
+        {k: list(lookup) for k, lookup in lookups.items()})
+
+
+def parse_group_by(specs):
+    group_by = []
+    for spec in specs:
+        keys = tuple(spec.split('+'))
+        unknown = [k for k in keys if k not in GROUP_KEYS]
+        if unknown:
+            raise ValueError(f'Unknown group-by key(s): {", ".join(unknown)}')
+        group_by.append(keys)
+    return group_by
+
+
+def group_counts(columns, keys):
+    stacked = np.stack([columns.key_column(k) for k in keys])
+    groups, inverse = np.unique(stacked, axis=1, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), minlength=groups.shape[1])
+    return sorted((' / '.join(columns.key_label(k, int(v)) for k, v in zip(keys, group)), int(count))
+                  for group, count in zip(groups.T, counts))
+
+
+def get_stat_info(columns):
+    output = {}
+    fat_avg = float(columns.filled('Fatalities').sum()) / len(columns)
+    output['title'] = 'Statistical insights:'
+    output[1] = ['Average fatalities for all accidents', round(fat_avg, 2)]
+    output[2] = ['Total number of passengers aboard during all flights',
+                 int(columns.filled('Aboard').sum())]
+    return output
+
+
+def get_aggreg_info(columns, keys):
+    output = {}
+    output['title'] = 'Aggregate insights:'
+    label = 'Accidents by year' if keys == ('decade',) \
+        else f'Accidents by {" and ".join(keys)}'
+    output[1] = [label, group_counts(columns, keys)]
+    return output
+
+
+def get_summary_info(columns):
+    output = {}
+    output['title'] = 'Summary insights:'
+    output[1] = ['Total number of accidents', len(columns)]
+    output[2] = ['Airlines involved overall', len(columns.categories['operator'])]
+    return output
+
+
+def build_report(filename, group_by=DEFAULT_GROUP_BY):
+    columns = load_columns(filename)
+    if not len(columns):
+        raise ValueError('No data found')
+    report = [get_stat_info(columns)]
+    report.extend(get_aggreg_info(columns, keys) for keys in group_by)
+    report.append(get_summary_info(columns))
+    return report
@@ -3,46 +3,105 @@
 import sys
 import os
 import argparse
+import hashlib
+import io
+import json
 import math
 import logging
 import csv
+import glob
 import openpyxl
-from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from openpyxl.styles import Alignment
+from itertools import repeat
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, NamedStyle
 from openpyxl.styles.borders import Border, Side
 
 READ_MODE = 'r'
+SNIFF_SIZE = 1024
 logging.basicConfig(
     format='%(asctime)s > %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p',
     filename='output.log', level=logging.DEBUG
 )
 XLS_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'),
                     top=Side(style='thin'), bottom=Side(style='thin'))
+XLS_SHEET_TITLE_LIMIT = 31
+DISTINCT_ERROR = 0.01
+HLL_MIN_PRECISION = 7
+CACHE_SUFFIX = '.aggcache'
+CACHE_VERSION = 2
+CACHE_READ_SIZE = 1024 * 1024
+
+
+def positive_float(value):
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'must be a positive number: {value}')
+    return number
 
 
 def run():
     parser = argparse.ArgumentParser(
         description="An app that analyzes a given flight dataset")
-    parser.add_argument('dataset', help='a file containing the input dataset')
+    parser.add_argument('dataset', nargs='+',
+                        help='files containing the input dataset, or directories of CSV files')
     parser.add_argument("-o", "--optional",
                         help="generate Excel report", nargs='*')
+    parser.add_argument('-w', '--write-only', action='store_true',
+                        help='stream the Excel report to disk, one sheet per report part')
+    parser.add_argument('--single-sheet', action='store_true',
+                        help='put all parts on one sheet in the write-only mode')
+    parser.add_argument('-a', '--approximate', action='store_true',
+                        help='count distinct airlines with a fixed-size HyperLogLog sketch')
+    parser.add_argument('--distinct-error', type=positive_float, default=DISTINCT_ERROR,
+                        help='relative standard error of the approximate distinct count')
+    parser.add_argument('-c', '--columnar', action='store_true',
+                        help='compute the report from typed NumPy columns')
+    parser.add_argument('-g', '--group-by', nargs='+',
+                        help='accident breakdowns for the columnar report, keys are '
+                        'year, decade, operator, type and location, joined with + to combine')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='number of processes aggregating the datasets in the batch mode')
+    parser.add_argument('--per-file-sheets', action='store_true',
+                        help='add a sheet per dataset to the batch Excel report')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the aggregates next to the dataset and process only appended rows')
     args = parser.parse_args()
+    if args.group_by and not args.columnar:
+        parser.error('--group-by works only in the columnar mode (-c)')
     try:
-        received = _read_csv(args.dataset.strip())
-        if not received:
-            raise ValueError('No data found')
-        parsed_list = _parse_csv()
-        report = []
-        report.append(_get_stat_info(parsed_list))
-        report.append(_get_aggreg_info(parsed_list))
-        report.append(_get_summary_info(parsed_list))
+        datasets = _expand_datasets(args.dataset)
+        per_file = {}
+        for dataset in datasets:
+            received = _read_csv(dataset)
+            if not received:
+                raise ValueError('No data found')
+        if len(datasets) > 1:
+            if args.columnar:
+                raise ValueError('The columnar mode works on a single dataset')
+            report, per_file = _build_batch_report(
+                datasets, args.approximate, args.distinct_error, args.workers, args.cache)
+            if not args.per_file_sheets:
+                per_file = {}
+        elif args.columnar:
+            import columnar
+            report = columnar.build_report(
+                os.environ.get('DATAFILE'), columnar.parse_group_by(args.group_by or ['decade']))
+        elif args.cache:
+            report = _report_from(_collect_file(
+                datasets[0], args.approximate, args.distinct_error, True))
+        else:
+            report = _build_report(_iter_csv(), args.approximate, args.distinct_error)
         if args.optional is not None:
             if args.optional:
                 os.environ['XLS_NAME'] = args.optional[0]
-            _generate_xls_report(report)
+            if args.write_only or per_file:
+                _generate_streaming_xls_report(report, not args.single_sheet, per_file)
+            else:
+                _generate_xls_report(report)
         else:
-            _print_report(report[2])
+            _print_report(report[-1])
     except ValueError as e:
         logging.exception(str(e))
     except AssertionError as e:
@@ -55,29 +114,260 @@ def _read_csv(filename):
     os.environ['DATAFILE'] = filename
     try:
         with open(filename) as fobj:
-            data = fobj.read()
+            data = fobj.read(SNIFF_SIZE)
     except IOError:
         logging.exception('Could not read a file at the given path!')
     return data
 
 
+def _expand_datasets(paths):
+    datasets = []
+    for path in paths:
+        path = path.strip()
+        if os.path.isdir(path):
+            datasets.extend(sorted(glob.glob(os.path.join(path, '*.csv'))))
+        else:
+            datasets.append(path)
+    if not datasets:
+        raise ValueError('No data found')
+    return datasets
+
+
 def _parse_csv():
-    with open(os.environ.get('DATAFILE')) as datafile:
-        d = csv.Sniffer().sniff(datafile.read(1024))
+    return list(_iter_csv())
+
+
+def _iter_csv(filename=None):
+    with open(filename or os.environ.get('DATAFILE')) as datafile:
+        d = csv.Sniffer().sniff(datafile.read(SNIFF_SIZE))
         datafile.seek(0)
-        dictReader = csv.DictReader(datafile, dialect=d)
-        return list(dictReader)
+        yield from csv.DictReader(datafile, dialect=d)
+
+
+# Every report part is an aggregator fed row by row, so the whole report is
+# built in a single pass over the dataset
+def _build_report(rows, approximate=False, error=DISTINCT_ERROR):
+    return _report_from(_collect(rows, approximate, error))
+
+
+def _new_aggregators(approximate=False, error=DISTINCT_ERROR):
+    return [StatInfo(), AggregInfo(), SummaryInfo(approximate, error)]
+
+
+def _collect(rows, approximate=False, error=DISTINCT_ERROR):
+    aggregators = _new_aggregators(approximate, error)
+    for row in rows:
+        for aggregator in aggregators:
+            aggregator.update(row)
+    return aggregators
+
+
+def _collect_file(filename, approximate=False, error=DISTINCT_ERROR, use_cache=False):
+    if use_cache:
+        return _collect_file_cached(filename, approximate, error)
+    return _collect(_iter_csv(filename), approximate, error)
+
+
+def _hash_prefix(filename, size):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as datafile:
+        while size > 0:
+            chunk = datafile.read(min(size, CACHE_READ_SIZE))
+            if not chunk:
+                break
+            digest.update(chunk)
+            size -= len(chunk)
+    return digest
+
+
+# Also returns the hash of the cached prefix, so appended bytes can be added
+# to it instead of hashing the whole dataset again
+def _load_cache(filename, approximate, error):
+    try:
+        with open(filename + CACHE_SUFFIX) as stream:
+            cache = json.load(stream)
+    except (OSError, ValueError):
+        return None, None
+    if cache.get('version') != CACHE_VERSION or cache.get('approximate') != approximate \
+            or cache.get('error') != error:
+        return None, None
+    size = os.path.getsize(filename)
+    digest = None
+    if size == cache['size'] or (size > cache['size'] and cache['ends_with_newline']):
+        digest = _hash_prefix(filename, cache['size'])
+    if digest is None or digest.hexdigest() != cache['fingerprint']:
+        logging.info('Dataset %s was edited, rebuilding the aggregates', filename)
+        return None, None
+    return cache, digest
+
+
+def _save_cache(filename, aggregators, fieldnames, delimiter, approximate, error,
+                size, digest, ends_with_newline):
+    cache = {'version': CACHE_VERSION, 'approximate': approximate, 'error': error,
+             'size': size, 'fingerprint': digest.hexdigest(),
+             'ends_with_newline': ends_with_newline, 'fieldnames': fieldnames,
+             'delimiter': delimiter, 'state': [a.to_state() for a in aggregators]}
+    tmp_path = filename + CACHE_SUFFIX + '.tmp'
+    with open(tmp_path, 'w') as stream:
+        json.dump(cache, stream)
+    os.replace(tmp_path, filename + CACHE_SUFFIX)
+
+
+# Rows appended since the cached size are read with the stored header and
+# delimiter and merged into the cached aggregates, any other edit of the
+# dataset leads to a full rebuild. A dataset without new rows is only hashed
+# once and its cache is left as it is
+def _collect_file_cached(filename, approximate=False, error=DISTINCT_ERROR):
+    cache, digest = _load_cache(filename, approximate, error)
+    if cache is None:
+        with open(filename) as datafile:
+            dialect = csv.Sniffer().sniff(datafile.read(SNIFF_SIZE))
+            datafile.seek(0)
+            reader = csv.DictReader(datafile, dialect=dialect)
+            aggregators = _collect(reader, approximate, error)
+            fieldnames, delimiter = reader.fieldnames, dialect.delimiter
+        size = os.path.getsize(filename)
+        digest = _hash_prefix(filename, size)
+        with open(filename, 'rb') as datafile:
+            datafile.seek(max(size - 1, 0))
+            ends_with_newline = datafile.read(1) == b'\n'
+    else:
+        fieldnames, delimiter = cache['fieldnames'], cache['delimiter']
+        aggregators = _new_aggregators(approximate, error)
+        for aggregator, state in zip(aggregators, cache['state']):
+            aggregator.load_state(state)
+        with open(filename, 'rb') as raw:
+            raw.seek(cache['size'])
+            appended = raw.read()
+        if not appended:
+            return aggregators
+        digest.update(appended)
+        size = cache['size'] + len(appended)
+        ends_with_newline = appended.endswith(b'\n')
+        rows = csv.DictReader(io.TextIOWrapper(io.BytesIO(appended)), fieldnames=fieldnames,
+                              delimiter=delimiter)
+        for aggregator, new in zip(aggregators, _collect(rows, approximate, error)):
+            aggregator.merge(new)
+    _save_cache(filename, aggregators, fieldnames, delimiter, approximate, error,
+                size, digest, ends_with_newline)
+    return aggregators
+
+
+def _report_from(aggregators):
+    if not aggregators[0].count:
+        raise ValueError('No data found')
+    return [aggregator.report() for aggregator in aggregators]
+
+
+# Every dataset is aggregated in its own process, the partial aggregates are
+# then merged into the combined report
+def _build_batch_report(filenames, approximate=False, error=DISTINCT_ERROR, workers=None,
+                        use_cache=False):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(_collect_file, filenames, repeat(approximate),
+                                     repeat(error), repeat(use_cache)))
+    merged = _new_aggregators(approximate, error)
+    for partial in partials:
+        for aggregator, other in zip(merged, partial):
+            aggregator.merge(other)
+    per_file = {f: _report_from(p) for f, p in zip(filenames, partials) if p[0].count}
+    return _report_from(merged), per_file
+
+
+def _aggregate(aggregator, source):
+    for row in source:
+        aggregator.update(row)
+    return aggregator.report()
+
+
+class StatInfo:
+    def __init__(self):
+        self.count = 0
+        self.fatalities = 0
+        self.aboard = 0
+
+    def update(self, row):
+        self.count += 1
+        self.fatalities += get_int_from_str(row['Fatalities'])
+        self.aboard += get_int_from_str(row['Aboard'])
+
+    def merge(self, other):
+        self.count += other.count
+        self.fatalities += other.fatalities
+        self.aboard += other.aboard
+
+    def to_state(self):
+        return {'count': self.count, 'fatalities': self.fatalities, 'aboard': self.aboard}
+
+    def load_state(self, state):
+        self.count = state['count']
+        self.fatalities = state['fatalities']
+        self.aboard = state['aboard']
+
+    def report(self):
+        output = {}
+        fat_avg = float(self.fatalities) / self.count
+        output['title'] = 'Statistical insights:'
+        output[1] = ['Average fatalities for all accidents', round(fat_avg, 2)]
+        output[2] = ['Total number of passengers aboard during all flights', self.aboard]
+        return output
+
+
+class AggregInfo:
+    def __init__(self):
+        self.by_decade = {}
+
+    def update(self, row):
+        decade = extract_year('Date', row['Date'])
+        self.by_decade[decade] = self.by_decade.get(decade, 0) + 1
+
+    def merge(self, other):
+        for decade, count in other.by_decade.items():
+            self.by_decade[decade] = self.by_decade.get(decade, 0) + count
+
+    def to_state(self):
+        return {'by_decade': self.by_decade}
+
+    def load_state(self, state):
+        self.by_decade = dict(state['by_decade'])
+
+    def report(self):
+        output = {}
+        output['title'] = 'Aggregate insights:'
+        output[1] = ['Accidents by year', sorted(self.by_decade.items())]
+        return output
+
+
+class SummaryInfo:
+    def __init__(self, approximate=False, error=DISTINCT_ERROR):
+        self.count = 0
+        self.operators = new_distinct_counter(approximate, error)
+
+    def update(self, row):
+        self.count += 1
+        self.operators.add(row['Operator'])
+
+    def merge(self, other):
+        self.count += other.count
+        self.operators.merge(other.operators)
+
+    def to_state(self):
+        return {'count': self.count, 'operators': self.operators.to_state()}
+
+    def load_state(self, state):
+        self.count = state['count']
+        self.operators.load_state(state['operators'])
+
+    def report(self):
+        output = {}
+        output['title'] = 'Summary insights:'
+        output[1] = ['Total number of accidents', self.count]
+        output[2] = ['Airlines involved overall', self.operators.count()]
+        return output
 
 
 def _get_stat_info(source):
-    output = {}
-    fat_avg = float(sum(get_int_from_str(
-        r['Fatalities']) for r in source)) / len(source)
-    aboard_sum = sum(get_int_from_str(r['Aboard']) for r in source)
-    output['title'] = 'Statistical insights:'
-    output[1] = ['Average fatalities for all accidents', round(fat_avg, 2)]
-    output[2] = ['Total number of passengers aboard during all flights', aboard_sum]
-    return output
+    return _aggregate(StatInfo(), source)
 
 
 def get_int_from_str(val):
@@ -87,21 +377,7 @@ def get_int_from_str(val):
 
 
 def _get_aggreg_info(source):
-    output = {}
-    mapped_source = []
-    for d in source:
-        newdict = dict(
-            map(lambda kv: (kv[0], extract_year(kv[0], kv[1])), d.items()))
-        mapped_source.append(newdict)
-    by_year = [(k, len(list(g)))
-               for k, g in groupby(sorted(mapped_source, key=keyfn), keyfn)]
-    output['title'] = 'Aggregate insights:'
-    output[1] = ['Accidents by year', by_year]
-    return output
-
-
-def keyfn(x):
-    return x['Date']
+    return _aggregate(AggregInfo(), source)
 
 
 def extract_year(key, value):
@@ -113,21 +389,71 @@ def extract_year(key, value):
 
 
 def _get_summary_info(source):
-    output = {}
-    all_accid = len(source)
-    all_airlines = count_distinct(source)['Operator']
-    output['title'] = 'Summary insights:'
-    output[1] = ['Total number of accidents', all_accid]
-    output[2] = ['Airlines involved overall', all_airlines]
-    return output
+    return _aggregate(SummaryInfo(), source)
+
+
+def new_distinct_counter(approximate=False, error=DISTINCT_ERROR):
+    return HyperLogLog(error) if approximate else ExactDistinct()
+
+
+class ExactDistinct:
+    def __init__(self):
+        self.values = set()
+
+    def add(self, value):
+        self.values.add(value)
+
+    def merge(self, other):
+        self.values |= other.values
+
+    def to_state(self):
+        return sorted(self.values)
+
+    def load_state(self, state):
+        self.values = set(state)
+
+    def count(self):
+        return len(self.values)
 
 
-def count_distinct(arg_list):
-    values_per_key = {}
-    for d in arg_list:
-        for k, v in d.items():
-            values_per_key.setdefault(k, set()).add(v)
-    return {k: len(v) for k, v in values_per_key.items()}
+# HyperLogLog: 2^p one-byte registers keep the longest run of leading zero
+# bits seen per hash bucket, the standard error is about 1.04 / sqrt(2^p).
+# The bias correction below only holds from 128 registers up, so p >= 7
+class HyperLogLog:
+    def __init__(self, error=DISTINCT_ERROR):
+        self.p = min(max(math.ceil(math.log2((1.04 / error) ** 2)), HLL_MIN_PRECISION), 18)
+        self.m = 1 << self.p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(
+            str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError('Cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_state(self):
+        return {'p': self.p, 'registers': self.registers.hex()}
+
+    def load_state(self, state):
+        self.p = state['p']
+        self.m = 1 << self.p
+        self.registers = bytearray.fromhex(state['registers'])
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
 
 
 def _print_report(report):
@@ -151,11 +477,93 @@ def _generate_xls_report(report):
         sheet.merge_cells(start_row=sheet._current_row,
                           start_column=1, end_row=sheet._current_row, end_column=2)
         process_report_part(part, sheet)
+    workbook.save(_get_xls_name())
+
+
+def _get_xls_name():
     if os.environ.get('XLS_NAME'):
-        workbook.save(os.environ.get('XLS_NAME'))
-    else:
-        now = datetime.now()
-        workbook.save(f'report-{now.strftime("%d-%m-%Y-%H_%M_%S")}.xlsx')
+        return os.environ.get('XLS_NAME')
+    now = datetime.now()
+    return f'report-{now.strftime("%d-%m-%Y-%H_%M_%S")}.xlsx'
+
+
+# Write-only workbook: rows are appended one by one and flushed to disk, the
+# styling comes from named styles registered once per workbook
+def _generate_streaming_xls_report(report, sheet_per_part=True, per_file=None):
+    workbook = openpyxl.Workbook(write_only=True)
+    for style in get_named_styles():
+        workbook.add_named_style(style)
+    sheet = None
+    for part in report:
+        if sheet is None or sheet_per_part:
+            sheet = create_streaming_sheet(
+                workbook, get_sheet_title(part) if sheet_per_part else 'Report')
+            row = 1
+        row = write_report_part(part, sheet, row)
+    # Sheets are named after the file, create_streaming_sheet numbers the ones
+    # that share a name and the first row tells which file it is
+    for filename, file_report in (per_file or {}).items():
+        sheet = create_streaming_sheet(
+            workbook, os.path.splitext(os.path.basename(filename))[0])
+        row = append_styled_row(sheet, 1, [filename, None], 'report_label', merge=True)
+        for part in file_report:
+            row = write_report_part(part, sheet, row)
+    workbook.save(_get_xls_name())
+
+
+def get_named_styles():
+    title = NamedStyle(name='report_title', border=XLS_BORDER,
+                       font=openpyxl.styles.Font(color="0000FF", bold=True))
+    label = NamedStyle(name='report_label', border=XLS_BORDER,
+                       alignment=Alignment(horizontal='center'))
+    cell = NamedStyle(name='report_cell', border=XLS_BORDER)
+    return [title, label, cell]
+
+
+def get_sheet_title(part):
+    if part['title'] == 'Aggregate insights:':
+        return part[1][0]
+    return part['title'].rstrip(':')
+
+
+def create_streaming_sheet(workbook, title):
+    title = title[:XLS_SHEET_TITLE_LIMIT]
+    taken = set(workbook.sheetnames)
+    candidate, n = title, 1
+    while candidate in taken:
+        n += 1
+        candidate = f'{title[:XLS_SHEET_TITLE_LIMIT - len(str(n)) - 1]} {n}'
+    sheet = workbook.create_sheet(candidate)
+    sheet.column_dimensions['A'].width = 50
+    sheet.column_dimensions['B'].width = 60
+    return sheet
+
+
+# A write-only sheet does not know its row count, so the caller passes the
+# number of the row being appended and gets the next one back
+def append_styled_row(sheet, row, values, style, merge=False):
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style
+        cells.append(cell)
+    sheet.append(cells)
+    if merge:
+        sheet.merged_cells.add(f'A{row}:B{row}')
+    return row + 1
+
+
+def write_report_part(part, sheet, row):
+    row = append_styled_row(sheet, row, [part['title'], None], 'report_title', merge=True)
+    if part['title'] == 'Aggregate insights:':
+        row = append_styled_row(sheet, row, [part[1][0], None], 'report_label', merge=True)
+        for pair in part[1][1]:
+            row = append_styled_row(sheet, row, pair, 'report_cell')
+        return row
+    for key, value in part.items():
+        if key != 'title':
+            row = append_styled_row(sheet, row, value, 'report_cell')
+    return row
 
 
 def process_report_part(part, sheet):
@@ -1,61 +1,490 @@
 from tkinter import *
-from tkinter import messagebox
 from tkinter.ttk import Button, Style
-
-import matplotlib.pyplot as plt
-from pandas import DataFrame
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from collections import defaultdict
 
 import sqlite3
+import codecs
 import datetime
-import requests
+import json
+import os
+import queue
+import re
+import threading
+import time
 
 app = None
-JSON_LINK = 'https://data.wa.gov/api/views/d886-d5q2/rows.json'
+DB_FILE = 'application.db'
+JSON_LINK = os.environ.get(
+    'DATA_URL', 'https://data.wa.gov/api/views/d886-d5q2/rows.json')
+DOWNLOAD_CHUNK = 1024 * 1024
+INSERT_BATCH = 10000
+INGEST_PRAGMAS = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL',
+                  'PRAGMA cache_size=-65536', 'PRAGMA temp_store=MEMORY')
+UPSERT_QUERY = '''
+    INSERT INTO cars VALUES(?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET ev_count = excluded.ev_count, date = excluded.date;
+'''
+SYNC_STATE_QUERY = '''
+    INSERT INTO sync_state VALUES(?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET etag = excluded.etag,
+        last_modified = excluded.last_modified, last_row_update = excluded.last_row_update;
+'''
+OLD_MONTH_TRIGGERS = ('cars_month_insert', 'cars_month_update', 'cars_month_delete')
+DATE_INDEX_QUERY = 'CREATE INDEX IF NOT EXISTS cars_date ON cars(date);'
+MONTH_BACKFILL_QUERY = '''
+    INSERT INTO month_totals
+    SELECT coalesce(substr(date, 1, 7), ''), SUM(ev_count), COUNT(*) FROM cars GROUP BY 1;
+'''
+OLD_MONTHS_QUERY = '''
+    SELECT coalesce(substr(date, 1, 7), ''), SUM(ev_count), COUNT(*) FROM cars
+    WHERE id IN (SELECT value FROM json_each(?)) GROUP BY 1;
+'''
+MONTH_DELTA_QUERY = '''
+    INSERT INTO month_totals VALUES(?, ?, ?)
+    ON CONFLICT(month) DO UPDATE SET ev_count = ev_count + excluded.ev_count,
+        rows = rows + excluded.rows;
+'''
+UPDATED_AT = 5
+POLL_INTERVAL = 100
+CLOSE_TIMEOUT = 0.5
+PLOT_DEBOUNCE = 150
+json_whitespace = re.compile(r'[ \t\r\n]*')
+json_separator = re.compile(r'[ \t\r\n]*,[ \t\r\n]*')
 
 
 def main():
     global app
     try:
-        conn = sqlite3.connect('application.db')
+        conn = sqlite3.connect(DB_FILE)
+        create_schema(conn)
         app = App(conn)
         app.run()
     except Exception as e:
         print('A problem appeared when establishing a DB connection!', e)
 
 
-def get_raw():
-    try:
-        fetched = requests.get(JSON_LINK)
-        return fetched.json()
-    except ValueError as e:
-        messagebox.showerror('File error', 'The data cannot be loaded!')
-        print(e)
-
-
-def load_data(conn):
-    cursor = conn.cursor()
-    if not app.scheme_present:
-        cursor.execute('''
+def create_schema(conn):
+    conn.execute('''
 			CREATE TABLE IF NOT EXISTS cars(
 				id TEXT PRIMARY KEY,
 				ev_count INT NOT NULL,
 				date timestamp);
 			''')
-        app.scheme_present = True
-        conn.commit()
-    if app.data_present:
-        cursor.close()
-        app.status.config(text='Some data is still present - clear the DB!')
-        return
+    conn.execute('''
+			CREATE TABLE IF NOT EXISTS sync_state(
+				url TEXT PRIMARY KEY,
+				etag TEXT,
+				last_modified TEXT,
+				last_row_update INT NOT NULL DEFAULT 0);
+			''')
+    conn.execute(DATE_INDEX_QUERY)
+    create_month_totals(conn)
+    conn.commit()
+
+
+# Totals per month are kept up to date by ingest_rows once per batch, so the
+# sum and the graph read O(months) rows instead of scanning the whole table.
+# Empty totals are rebuilt, like after a first load that was cut short
+def create_month_totals(conn):
+    conn.execute('''
+			CREATE TABLE IF NOT EXISTS month_totals(
+				month TEXT PRIMARY KEY,
+				ev_count INT NOT NULL,
+				rows INT NOT NULL);
+			''')
+    for trigger in OLD_MONTH_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger};')
+    if conn.execute('SELECT 1 FROM month_totals LIMIT 1').fetchone() is None:
+        conn.execute(MONTH_BACKFILL_QUERY)
+
+
+def get_month_totals(conn, start='0000-00', end='9999-99'):
+    return conn.execute("SELECT month, ev_count FROM month_totals WHERE month != '' "
+                        'AND month >= ? AND month <= ? ORDER BY month',
+                        (start, end)).fetchall()
+
+
+def get_day_totals(conn, start, end):
+    return conn.execute('SELECT substr(date, 1, 10) AS day, SUM(ev_count) FROM cars '
+                        'WHERE date >= ? AND date < ? GROUP BY day ORDER BY day',
+                        (start, end)).fetchall()
+
+
+# numpy, matplotlib and requests are imported where they are first needed,
+# so opening the window does not pay for them
+def to_series(rows, unit):
+    import matplotlib.dates as mdates
+    import numpy as np
+
+    if not rows:
+        return np.empty(0), np.empty(0)
+    dates, counts = zip(*rows)
+    return (mdates.date2num(np.array(dates, dtype=f'datetime64[{unit}]')),
+            np.array(counts, dtype=float))
+
+
+# Keeps the first point, the last point and the lowest and highest point of
+# every bucket, so a line drawn through them looks the same at that width
+def downsample_minmax(x, y, buckets):
+    import numpy as np
+
+    if len(x) <= 2 * buckets + 2:
+        return x, y
+    bucket = np.minimum(((x - x[0]) / (x[-1] - x[0]) * buckets).astype(int), buckets - 1)
+    order = np.lexsort((y, bucket))
+    ends = np.flatnonzero(np.diff(bucket[order])) + 1
+    picked = np.concatenate((order[np.r_[0, ends]], order[np.r_[ends - 1, len(x) - 1]],
+                             [0, len(x) - 1]))
+    picked = np.unique(picked)
+    return x[picked], y[picked]
+
+
+def load_sync_state(conn, url):
+    row = conn.execute('SELECT etag, last_modified, last_row_update FROM sync_state '
+                       'WHERE url = ?', (url,)).fetchone()
+    return row or (None, None, 0)
+
+
+def save_sync_state(conn, url, etag, last_modified, last_row_update):
+    conn.execute(SYNC_STATE_QUERY, (url, etag, last_modified, last_row_update))
+    conn.commit()
+
+
+def get_conditional_headers(etag, last_modified):
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+# Downloads and inserts on its own thread and connection, the UI learns about
+# the progress only through the events queue. Cancelling is checked for every
+# downloaded chunk and after every batch
+class DataLoader(threading.Thread):
+    def __init__(self, db_path, url, events):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.url = url
+        self.events = events
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+
+    def report(self, kind, payload=None):
+        self.events.put((kind, payload))
+
+    def run(self):
+        import requests
+
+        conn = sqlite3.connect(self.db_path)
+        self.ingested = 0
+        try:
+            create_schema(conn)
+            etag, last_modified, since = load_sync_state(conn, self.url)
+            headers = get_conditional_headers(etag, last_modified)
+            with requests.get(self.url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 304:
+                    self.report('unchanged')
+                    return
+                response.raise_for_status()
+                rows = ChangedRows(iter_data_rows(self.iter_chunks(response)), since)
+                ingest_rows(conn, rows, INSERT_BATCH, self.on_batch)
+            if self.ingested < 1 and rows.skipped < 1:
+                raise ValueError('No values were found for adding to the DB')
+            save_sync_state(conn, self.url, response.headers.get('ETag'),
+                            response.headers.get('Last-Modified'), rows.latest)
+            self.report('done', (self.ingested, rows.skipped))
+        except LoadCancelled:
+            self.report('cancelled', self.ingested)
+        except (requests.RequestException, ValueError, sqlite3.Error) as e:
+            self.report('error', str(e))
+        finally:
+            conn.close()
+
+    def iter_chunks(self, response):
+        for chunk in response.iter_content(DOWNLOAD_CHUNK):
+            self.check_cancelled()
+            yield chunk
+
+    def on_batch(self, done, speed):
+        self.ingested = done
+        self.report('progress', f'Ingested {done} rows ({speed:.0f} rows/s)')
+        self.check_cancelled()
+
+
+# Passes on only the rows updated after the last sync and remembers the
+# newest update seen, rows without an update time are always passed on
+class ChangedRows:
+    def __init__(self, rows, since):
+        self.rows = rows
+        self.since = since
+        self.latest = since
+        self.skipped = 0
+
+    def __iter__(self):
+        for item in self.rows:
+            updated = item[UPDATED_AT]
+            if updated is None or updated > self.since:
+                if updated is not None and updated > self.latest:
+                    self.latest = updated
+                yield item
+            else:
+                self.skipped += 1
+
+
+# Walks the top-level object of the export and yields the elements of its
+# "data" array one at a time, everything else is decoded and dropped
+def iter_data_rows(chunks):
+    reader = JsonChunkReader(chunks)
+    reader.expect('{')
+    while not reader.accept('}'):
+        key = reader.decode_value()
+        reader.expect(':')
+        if key != 'data':
+            reader.decode_value()
+        else:
+            reader.expect('[')
+            yield from reader.iter_array()
+        reader.accept(',')
+
+
+class JsonChunkReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            if self.exhausted:
+                raise ValueError('Unexpected end of the JSON document')
+            self.exhausted = True
+            chunk = b''
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk, self.exhausted)
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            self.pos = json_whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.fill()
+
+    def accept(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.accept(char):
+            raise ValueError(f'Expected {char!r} in the JSON document')
+
+    # An element followed by a comma inside the buffer is complete, so most
+    # elements take one decode and one match; the rest, like an element cut
+    # at the end of the buffer, go through decode_value
+    def iter_array(self):
+        if self.accept(']'):
+            return
+        raw_decode = self.decoder.raw_decode
+        match_separator = json_separator.match
+        while True:
+            buffer = self.buffer
+            try:
+                value, end = raw_decode(buffer, self.pos)
+                separator = match_separator(buffer, end)
+            except json.JSONDecodeError:
+                separator = None
+            if separator and separator.end() < len(buffer):
+                self.pos = separator.end()
+                yield value
+                continue
+            yield self.decode_value()
+            if not self.accept(','):
+                self.expect(']')
+                return
+            self.peek()
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if (end < len(self.buffer) and self.buffer[end] in ' \t\r\n,:]}') \
+                        or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+
+def get_row_values(item):
+    return (item[1], int(item[-1]), datetime.datetime.fromisoformat(item[-4]))
+
+
+# One figure and canvas for the whole session, the line data is replaced in
+# place. The full range is drawn from the month totals, zooming in re-queries
+# the visible range per day once there are more pixels than days
+class SeriesPlot:
+    def __init__(self, frame, conn):
+        import matplotlib.dates as mdates
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+
+        self.conn = conn
+        self.figure = Figure(figsize=(4, 4), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_title('Electric Vehicles Registered vs. Months')
+        self.line, = self.ax.plot([], [], color='r', marker='.', label='Vehicles amount')
+        self.ax.legend(fontsize=8)
+        locator = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        self.ax.tick_params(labelsize=8)
+        self.canvas = FigureCanvasTkAgg(self.figure, frame)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, frame, pack_toolbar=False)
+        self.pending = None
+        self.updating = False
+        self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
+    def grid(self, row, column):
+        self.canvas.get_tk_widget().grid(row=row, column=column, sticky='nsew')
+        self.toolbar.grid(row=row + 1, column=column, sticky='ew')
+
+    def get_buckets(self):
+        return max(int(self.ax.bbox.width), 1)
+
+    def query(self, start=None, end=None):
+        import matplotlib.dates as mdates
+
+        if start is None:
+            rows, unit = get_month_totals(self.conn), 'M'
+        else:
+            first = mdates.num2date(start) - datetime.timedelta(days=31)
+            last = mdates.num2date(end) + datetime.timedelta(days=31)
+            if end - start > self.get_buckets():
+                rows, unit = get_month_totals(self.conn, f'{first:%Y-%m}', f'{last:%Y-%m}'), 'M'
+            else:
+                rows, unit = get_day_totals(self.conn, f'{first:%Y-%m-%d}', f'{last:%Y-%m-%d}'), 'D'
+        x, y = to_series(rows, unit)
+        return downsample_minmax(x, y, self.get_buckets())
+
+    def show(self, x, y, rescale_x):
+        self.updating = True
+        try:
+            self.line.set_data(x, y)
+            self.ax.relim()
+            self.ax.autoscale_view(scalex=rescale_x)
+        finally:
+            self.updating = False
+        self.canvas.draw_idle()
+
+    def refresh(self):
+        self.show(*self.query(), rescale_x=True)
+        self.toolbar.update()
+
+    def on_xlim_changed(self, ax):
+        if self.updating:
+            return
+        widget = self.canvas.get_tk_widget()
+        if self.pending:
+            widget.after_cancel(self.pending)
+        self.pending = widget.after(PLOT_DEBOUNCE, self.requery)
+
+    def requery(self):
+        self.pending = None
+        self.show(*self.query(*self.ax.get_xlim()), rescale_x=False)
+
+
+# A row repeated in the batch counts once, with its last values. The months
+# lose what the replaced rows held, read with one grouped query, and gain the
+# new values, which are summed here instead of by a trigger on every row
+def apply_batch(conn, batch):
+    latest = {row[0]: row for row in batch}
+    deltas = defaultdict(lambda: [0, 0])
+    for month, ev_count, rows in conn.execute(OLD_MONTHS_QUERY, (json.dumps(list(latest)),)):
+        deltas[month][0] -= ev_count
+        deltas[month][1] -= rows
+    added = defaultdict(lambda: [0, 0])
+    for _, ev_count, date in latest.values():
+        delta = added[date.year, date.month]
+        delta[0] += ev_count
+        delta[1] += 1
+    for (year, month), (ev_count, rows) in added.items():
+        delta = deltas[f'{year:04}-{month:02}']
+        delta[0] += ev_count
+        delta[1] += rows
+    conn.executemany(UPSERT_QUERY, latest.values())
+    conn.executemany(MONTH_DELTA_QUERY, ((month, *delta) for month, delta in deltas.items()))
+    conn.execute('DELETE FROM month_totals WHERE rows = 0;')
+
+
+# Rows are upserted in batches, every batch in its own explicit transaction;
+# on_batch gets the running count and rows/s and may stop the ingest by raising.
+# A first load replaces nothing, so it only upserts and builds the date index
+# and the month totals once at the end, also when it is cancelled
+def ingest_rows(conn, rows, batch_size=INSERT_BATCH, on_batch=None):
+    for pragma in INGEST_PRAGMAS:
+        conn.execute(pragma)
+    conn.isolation_level = None
+    first_load = check_db_empty(conn.cursor())
+    if first_load:
+        conn.execute('DROP INDEX IF EXISTS cars_date;')
     try:
-        insert_to_db(cursor, conn, get_values(get_raw()))
-        cursor.close()
-        app.data_present = True
-        app.load_executed = True
-        app.status.config(text='Data was loaded into DB successfully')
-    except sqlite3.Error as e:
-        print(e)
+        return upsert_batches(conn, rows, batch_size, on_batch, first_load)
+    finally:
+        if first_load:
+            conn.execute('BEGIN')
+            conn.execute(DATE_INDEX_QUERY)
+            conn.execute('DELETE FROM month_totals;')
+            conn.execute(MONTH_BACKFILL_QUERY)
+            conn.execute('COMMIT')
+
+
+def upsert_batches(conn, rows, batch_size, on_batch, first_load):
+    started = time.monotonic()
+    done = 0
+    batch = []
+    rows = iter(rows)
+    while True:
+        batch.clear()
+        for item in rows:
+            batch.append(get_row_values(item))
+            if len(batch) >= batch_size:
+                break
+        if not batch:
+            break
+        conn.execute('BEGIN')
+        try:
+            if first_load:
+                conn.executemany(UPSERT_QUERY, batch)
+            else:
+                apply_batch(conn, batch)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        done += len(batch)
+        if on_batch:
+            on_batch(done, done / max(time.monotonic() - started, 1e-6))
+    return done
 
 
 def check_db_empty(cursor):
@@ -64,22 +493,13 @@ def check_db_empty(cursor):
 
 
 def get_values(json):
-    result = []
-    for item in json.get('data'):
-        result.append((item[1], int(item[-1]),
-                       datetime.datetime.strptime(item[-4], '%Y-%m-%dT%H:%M:%S')))
-    return result
-
-
-def insert_to_db(cursor, conn, vals):
-    if len(vals) < 1:
-        messagebox.showerror(
-            'Data error', 'No values were found for adding to the DB')
-    cursor.executemany('INSERT INTO cars VALUES(?, ?, ?);', vals)
-    conn.commit()
+    return [get_row_values(item) for item in json.get('data')]
 
 
 def clear_data(conn):
+    if app.loader:
+        app.status.config(text='Data is being loaded, cancel it first!')
+        return
     try:
         cursor = conn.cursor()
         if check_db_empty(cursor):
@@ -87,10 +507,14 @@ def clear_data(conn):
             cursor.close()
             return
         cursor.execute('DELETE FROM cars;')
+        cursor.execute('DELETE FROM month_totals;')
+        cursor.execute('DELETE FROM sync_state;')
         conn.commit()
         cursor.close()
         app.data_present = False
         app.load_executed = False
+        if app.plot:
+            app.plot.refresh()
         app.status.config(text='DB was cleared successfully')
     except sqlite3.Error as e:
         app.status.config(text='There was a problem clearing the DB!')
@@ -100,7 +524,7 @@ def clear_data(conn):
 def calc_sum(conn):
     if app.scheme_present and app.load_executed:
         cursor = conn.cursor()
-        cursor.execute('SELECT SUM(ev_count) FROM cars;')
+        cursor.execute('SELECT SUM(ev_count) FROM month_totals;')
         res = int(cursor.fetchone()[0])
         cursor.close()
         return res
@@ -113,13 +537,15 @@ class App(Tk):
         super().__init__()
         self.db_conn = db_conn
         self.scheme_present = False
-        self.data_present = check_db_empty(self.db_conn.cursor())
+        self.data_present = not check_db_empty(self.db_conn.cursor())
         self.load_executed = False
+        self.loader = None
+        self.load_events = queue.Queue()
 
     def run(self):
         self.resizable(width=False, height=False)
         self.title('Data display app')
-        self.geometry('{}x{}'.format(500, 550))
+        self.geometry('{}x{}'.format(600, 550))
         self.grid_rowconfigure(1, weight=1)
         self.grid_columnconfigure(0, weight=1)
         self.init_top()
@@ -129,13 +555,65 @@ class App(Tk):
         self.mainloop()
 
     def on_close(self):
+        if self.loader:
+            self.loader.cancel()
+            self.loader.join(CLOSE_TIMEOUT)
         self.db_conn.close()
         self.destroy()
 
+    def start_load(self):
+        if self.loader:
+            self.status.config(text='Data is being loaded already!')
+            return
+        self.loader = DataLoader(DB_FILE, JSON_LINK, self.load_events)
+        self.loader.start()
+        self.status.config(text='Loading data...')
+        self.after(POLL_INTERVAL, self.poll_loader)
+
+    def cancel_load(self):
+        if not self.loader:
+            self.status.config(text='Nothing is being loaded!')
+            return
+        self.loader.cancel()
+        self.status.config(text='Cancelling...')
+
+    def poll_loader(self):
+        while True:
+            try:
+                kind, payload = self.load_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                self.status.config(text=payload)
+            elif kind == 'done':
+                self.mark_loaded()
+                if self.plot:
+                    self.plot.refresh()
+                self.status.config(text='Data was synced successfully '
+                                        '({} new or changed, {} unchanged rows)'.format(*payload))
+            elif kind == 'unchanged':
+                self.mark_loaded()
+                self.status.config(text='Data is up to date, nothing was downloaded')
+            elif kind == 'cancelled':
+                self.status.config(text=f'Loading was cancelled, the {payload} rows '
+                                        'stored so far were kept')
+            elif kind == 'error':
+                self.status.config(text='The data cannot be loaded!')
+                print(payload)
+        if self.loader.is_alive() or not self.load_events.empty():
+            self.after(POLL_INTERVAL, self.poll_loader)
+        else:
+            self.loader = None
+
+    def mark_loaded(self):
+        self.scheme_present = True
+        self.data_present = True
+        self.load_executed = True
+
     def init_top(self):
         self.top = Frame(self, pady=3)
         self.top.grid(row=0, sticky='nsew')
-        for x in range(4):
+        for x in range(5):
             self.top.grid_columnconfigure(x, weight=1)
         self.layout_top()
 
@@ -147,19 +625,19 @@ class App(Tk):
         style.map('W.TButton', foreground=[('active', 'green')],
                   background=[('active', 'black')])
 
-        self.set_btn(self.top, 0, 0, 'Load data',
-                     lambda: load_data(self.db_conn))
-        self.set_btn(self.top, 0, 1, 'Clear database',
+        self.set_btn(self.top, 0, 0, 'Load data', self.start_load)
+        self.set_btn(self.top, 0, 1, 'Cancel', self.cancel_load)
+        self.set_btn(self.top, 0, 2, 'Clear database',
                      lambda: clear_data(self.db_conn))
-        self.set_btn(self.top, 0, 2, 'Calculate total', self.add_sum)
-        self.set_btn(self.top, 0, 3, 'Show graph', self.layout_center)
+        self.set_btn(self.top, 0, 3, 'Calculate total', self.add_sum)
+        self.set_btn(self.top, 0, 4, 'Show graph', self.layout_center)
 
     def add_sum(self):
         if not self.sum_visible:
             sum_text = self.get_sum()
             if sum_text:
                 self.sum_label = Label(self.top, text=sum_text, padx=10, pady=10) \
-                    .grid(row=1, column=0, columnspan=4, sticky='w')
+                    .grid(row=1, column=0, columnspan=5, sticky='w')
                 self.status.config(text='Sum calculated successfully')
                 self.sum_visible = True
         elif self.sum_label:
@@ -177,33 +655,21 @@ class App(Tk):
         return f'Calculated sum of vehicles: {calculated}'
 
     def init_center(self):
-        self.plot_area = None
+        self.plot = None
         self.center = Frame(self, padx=3, pady=3)
         self.center.grid(row=1, sticky='nsew')
         self.center.grid_rowconfigure(0, weight=1)
         self.center.grid_columnconfigure(0, weight=1)
 
     def layout_center(self):
-        if not self.plot_area and self.load_executed:
-            self.plot_area = self.get_plot(self.center)
-            self.plot_area.grid(row=0, column=0, sticky='nsew')
-            self.status.config(text='Graph displayed successfully')
-        elif self.plot_area:
-            self.status.config(text='Graph requested - already visible')
-        else:
+        if not self.load_executed:
             self.status.config(text='Data was not yet loaded!')
-
-    def get_plot(self, frame):
-        global df2
-        figure2 = plt.Figure(figsize=(4, 4), dpi=100)
-        ax2 = figure2.add_subplot(111)
-        line2 = FigureCanvasTkAgg(figure2, frame)
-        df2 = df2[['Month', 'Vehicles amount']].groupby('Month').sum()
-        df2.plot(kind='line', legend=True, ax=ax2,
-                 color='r', marker='o', fontsize=8)
-        ax2.set_title('Electric Vehicles Registered vs. Months')
-        line2.draw()
-        return line2.get_tk_widget()
+            return
+        if not self.plot:
+            self.plot = SeriesPlot(self.center, self.db_conn)
+            self.plot.grid(row=0, column=0)
+        self.plot.refresh()
+        self.status.config(text='Graph displayed successfully')
 
     def init_btm(self):
         bottom = Frame(self, bg='lavender', height=40)
@@ -224,10 +690,5 @@ class App(Tk):
         return btn
 
 
-data2 = {'Month': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
-         'Vehicles amount': [900.8, 1002, 800, 700.2, 600.9, 700, 600.5, 600.2, 500.5, 600.3]
-         }
-df2 = DataFrame(data2, columns=['Month', 'Vehicles amount'])
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import app
+import stand_in
+
+BENCH_ROWS = 2000000
+READ_CHUNK = 1024 * 1024
+
+
+def iter_file_chunks(path):
+    with open(path, 'rb') as source:
+        while True:
+            chunk = source.read(READ_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+def ingest_legacy(conn, path):
+    with open(path, encoding='utf-8') as source:
+        vals = app.get_values(json.load(source))
+    conn.executemany('INSERT OR REPLACE INTO cars VALUES(?, ?, ?);', vals)
+    conn.commit()
+    return len(vals)
+
+
+def ingest_streaming(conn, path, batch_size):
+    return app.ingest_rows(conn, app.iter_data_rows(iter_file_chunks(path)), batch_size)
+
+
+def time_ingest(name, func, path, *args):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(db_path)
+        app.create_schema(conn)
+        started = time.perf_counter()
+        rows = func(conn, path, *args)
+        elapsed = time.perf_counter() - started
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    print(f'{name}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)')
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Measures rows/s of the SQLite ingest')
+    parser.add_argument('fixture', nargs='?',
+                        help='rows.json to ingest, generated when missing')
+    parser.add_argument('-n', '--rows', type=int, default=BENCH_ROWS,
+                        help='number of rows of a generated fixture')
+    parser.add_argument('-b', '--batch-size', type=int, default=app.INSERT_BATCH)
+    parser.add_argument('--legacy', action='store_true',
+                        help='also time json.load followed by a single executemany')
+    args = parser.parse_args()
+    path = args.fixture
+    if path is None or not os.path.exists(path):
+        path = path or os.path.join(tempfile.gettempdir(), stand_in.FIXTURE_NAME)
+        print(f'Generating {args.rows} rows into {path}')
+        stand_in.generate_rows_json(path, args.rows)
+    time_ingest('streaming upsert', ingest_streaming, path, args.batch_size)
+    if args.legacy:
+        time_ingest('legacy', ingest_legacy, path)
+
+
+if __name__ == '__main__':
+    run()
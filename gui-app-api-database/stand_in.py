@@ -0,0 +1,143 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate, parsedate_to_datetime
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import uuid
+
+FIXTURE_NAME = 'rows.json'
+FIXTURE_ROWS = 100000
+PORT = 8000
+VERSION_GROWTH = 1000
+CHANGE_EVERY = 10
+FIRST_PUBLISHED = 1600000000
+VERSION_STEP = 10 ** 7
+
+
+def get_published(version):
+    return FIRST_PUBLISHED + VERSION_STEP * (version - 1)
+
+
+# Rows get the time of the version that added them and keep it until a later
+# version changes them, the way the export reports created_at/updated_at
+def make_row(n, rnd, version=1, added=1):
+    date = datetime.date(2017, 1, 31) + datetime.timedelta(days=30 * (n % 120))
+    created = updated = get_published(added) + n
+    row_id = str(uuid.UUID(int=rnd.getrandbits(128))).upper()
+    count = rnd.randint(1, 50000)
+    changed = version - (version - n) % CHANGE_EVERY
+    if changed > added:
+        updated = get_published(changed)
+        count += changed
+    return ['row-%d' % n, row_id, 0, created, None, updated, None, '{ }',
+            date.strftime('%Y-%m-%dT00:00:00'), 'Clark', 'WA', str(count)]
+
+
+# Writes a rows.json shaped like the data.wa.gov export, row by row so that
+# millions of rows do not need to fit in memory. Every later version appends
+# VERSION_GROWTH rows and changes the count of every CHANGE_EVERY-th row
+def generate_rows_json(path, rows=FIXTURE_ROWS, seed=0, version=1):
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write('{"meta": {"view": {"name": "Electric Vehicle Population Size History"}},'
+                  '\n"data": [\n')
+        for n in range(rows + VERSION_GROWTH * (version - 1)):
+            if n:
+                out.write(',\n')
+            added = 1 + max(n - rows + VERSION_GROWTH, 0) // VERSION_GROWTH
+            out.write(json.dumps(make_row(n, rnd, version, added)))
+        out.write('\n]}\n')
+
+
+def get_version_path(directory, version):
+    if version == 1:
+        return os.path.join(directory, FIXTURE_NAME)
+    return os.path.join(directory, f'rows.v{version}.json')
+
+
+# Serves the current version at /rows.json with an ETag and a Last-Modified,
+# answering conditional requests with 304; POST /advance publishes the next one
+class FixtureHandler(BaseHTTPRequestHandler):
+    directory = '.'
+    versions = 1
+    current = 1
+
+    def get_validators(self):
+        etag = f'"rows-v{self.current}"'
+        modified = get_published(self.current + 1) - 1
+        return etag, modified
+
+    def is_not_modified(self, etag, modified):
+        if 'If-None-Match' in self.headers:
+            return etag in self.headers['If-None-Match']
+        since = self.headers.get('If-Modified-Since')
+        if since:
+            try:
+                return modified <= parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/' + FIXTURE_NAME:
+            self.send_error(404)
+            return
+        etag, modified = self.get_validators()
+        if self.is_not_modified(etag, modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        path = get_version_path(self.directory, self.current)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(modified, usegmt=True))
+        self.end_headers()
+        with open(path, 'rb') as source:
+            shutil.copyfileobj(source, self.wfile)
+
+    def do_POST(self):
+        if self.path != '/advance':
+            self.send_error(404)
+            return
+        type(self).current = min(self.current + 1, self.versions)
+        body = f'version {self.current}\n'.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(directory, port=PORT, versions=1):
+    FixtureHandler.directory = directory
+    FixtureHandler.versions = versions
+    with ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler) as server:
+        print(f'Serving {directory} at http://127.0.0.1:{port}/{FIXTURE_NAME}')
+        server.serve_forever()
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Serves a generated rows.json in place of data.wa.gov')
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='where the fixture is written and served from')
+    parser.add_argument('-n', '--rows', type=int, default=FIXTURE_ROWS,
+                        help='number of generated rows')
+    parser.add_argument('-p', '--port', type=int, default=PORT)
+    parser.add_argument('-v', '--versions', type=int, default=1,
+                        help='number of fixture versions, see POST /advance')
+    args = parser.parse_args()
+    for version in range(1, args.versions + 1):
+        path = get_version_path(args.directory, version)
+        if not os.path.exists(path):
+            generate_rows_json(path, args.rows, version=version)
+    serve(args.directory, args.port, args.versions)
+
+
+if __name__ == '__main__':
+    run()
@@ -1,11 +1,70 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import bz2
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import ipaddress
+import json
+import lzma
+import mmap
+import os
 import re
+import socket
+import struct
 import sys
+import time
 
 log_line_pattern = re.compile(
     r'((?:\d+\.){3}\d+).*\[(\S+.+)\]\s+\"([A-Z]+)\s*(\S+).*\"\s+(\d{3})\s+(\d{3})')
 accepted_methods = ['GET', 'HEAD', 'POST', 'PUT',
                     'DELETE', 'TRACE', 'OPTIONS', 'CONNECT', 'PATCH']
+log_line_bytes_pattern = re.compile(log_line_pattern.pattern.encode('ascii'))
+accepted_bytes_methods = {m.encode('ascii') for m in accepted_methods}
+CLF_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+CACHE_LIMIT = 4096
+INDEX_SUFFIX = '.idx'
+INDEX_STEP = 1000
+CHUNK_SIZE = 16 * 1024 * 1024
+CHECKPOINT_SUFFIX = '.checkpoint'
+CACHE_SUFFIX = '.cache'
+CACHE_MAGIC = b'LOGC'
+CACHE_VERSION = 3
+CACHE_FINGERPRINT_SIZE = 64 * 1024
+FOLLOW_INTERVAL = 1.0
+READ_BUFFER = 1024 * 1024
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open,
+                      '.xz': lzma.open, '.lzma': lzma.open}
+RATE_WIDTHS = {'second': 1, 'minute': 60}
+RING_SIZE = 60
+SPIKE_WINDOW = 60
+SPIKE_BASELINE = 600
+SPIKE_FACTOR = 3.0
+SPIKE_MIN_REQUESTS = 10
+TOP_N = 50
+SKETCH_SIZE = 1000
+SKETCH_DEPTH = 4
+REPORT_DIMENSIONS = {
+    'paths': lambda log: log.request.path,
+    'client IPs': lambda log: log.ip,
+    'status codes': lambda log: log.request.status_code,
+}
+REPORT_METRICS = {
+    'request count': lambda log: 1,
+    'bytes': lambda log: log.request.size,
+}
+timestamp_pattern = re.compile(rb'\[([^\]]+)\]')
+_tz_cache = {}
+_date_cache = {}
+_day_epoch_cache = {}
 
 
 class MalformedHTTPRequest(Exception):
@@ -43,6 +102,122 @@ class LogEntry:
         return 'Log: %s %s %s' % (self.ip, str(self.timestamp), str(self.request))
 
 
+class LogEntryView:
+    __slots__ = ('columns', 'row')
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+    @property
+    def ip(self):
+        return self.columns.get_ip(self.row)
+
+    @property
+    def timestamp(self):
+        return self.columns.get_timestamp(self.row)
+
+    @property
+    def request(self):
+        return self.columns.get_request(self.row)
+
+    def __str__(self):
+        return 'Log: %s %s %s' % (self.ip, str(self.timestamp), str(self.request))
+
+
+# Column-oriented alternative to a list of LogEntry objects: numbers are kept
+# in typed arrays and repeating strings are dictionary-encoded
+class LogColumns:
+    COLUMNS = (('epochs', 'q'), ('utc_offsets', 'h'), ('ips', 'I'), ('status_codes', 'H'),
+               ('sizes', 'Q'), ('method_ids', 'B'), ('path_ids', 'I'))
+
+    def __init__(self):
+        self.epochs = array('q')
+        self.utc_offsets = array('h')
+        self.ips = array('I')
+        self.odd_ips = {}
+        self.status_codes = array('H')
+        self.sizes = array('Q')
+        self.method_ids = array('B')
+        self.path_ids = array('I')
+        self.methods = []
+        self.paths = []
+        self._method_lookup = {}
+        self._path_lookup = {}
+        self._timezones = {}
+
+    def make_writable(self, rows=None):
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            if rows is not None or not isinstance(column, array):
+                setattr(self, name, array(typecode, column[:rows]))
+        if rows is not None:
+            self.odd_ips = {row: ip for row, ip in self.odd_ips.items() if row < rows}
+        self._method_lookup = {m: i for i, m in enumerate(self.methods)}
+        self._path_lookup = {p: i for i, p in enumerate(self.paths)}
+
+    def append(self, log):
+        request = log.request
+        offset = log.timestamp.utcoffset()
+        self.epochs.append(int(log.timestamp.timestamp()))
+        self.utc_offsets.append(int(offset.total_seconds()) // 60)
+        try:
+            address = ipaddress.IPv4Address(log.ip)
+        except ValueError:
+            address = None
+        if address is None or str(address) != log.ip:
+            self.odd_ips[len(self.ips)] = log.ip
+            self.ips.append(0)
+        else:
+            self.ips.append(int(address))
+        self.status_codes.append(int(request.status_code))
+        self.sizes.append(request.size)
+        self.method_ids.append(self._intern(
+            request.method, self.methods, self._method_lookup))
+        self.path_ids.append(self._intern(
+            request.path, self.paths, self._path_lookup))
+
+    def _intern(self, value, values, lookup):
+        value_id = lookup.get(value)
+        if value_id is None:
+            value_id = lookup[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def get_ip(self, row):
+        if row in self.odd_ips:
+            return self.odd_ips[row]
+        return socket.inet_ntoa(self.ips[row].to_bytes(4, 'big'))
+
+    def get_timestamp(self, row):
+        offset = self.utc_offsets[row]
+        tz = self._timezones.get(offset)
+        if tz is None:
+            tz = self._timezones[offset] = timezone(timedelta(minutes=offset))
+        return datetime.fromtimestamp(self.epochs[row], tz)
+
+    def get_request(self, row):
+        return Request(self.methods[self.method_ids[row]], self.paths[self.path_ids[row]],
+                       str(self.status_codes[row]), self.sizes[row])
+
+    def nbytes(self):
+        columns = [getattr(self, name) for name, _ in self.COLUMNS]
+        return sum(len(c) * c.itemsize for c in columns) \
+            + sum(len(p.encode('utf-8')) for p in self.paths)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __getitem__(self, row):
+        if not -len(self) <= row < len(self):
+            raise IndexError('LogColumns index out of range')
+        return LogEntryView(self, row % len(self))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield LogEntryView(self, row)
+
+
 def convert_line(line):
     match = log_line_pattern.match(line)
     if match != None:
@@ -58,44 +233,928 @@ def convert_line(line):
         return None
 
 
-def convert_file(file):
-    res = []
-    wrong_requests = 0
+def iter_logs(file, stats):
     for line in file:
         try:
             obj = convert_line(line)
-            if obj is None:
-                wrong_requests += 1
-            else:
-                res.append(obj)
         except MalformedHTTPRequest:
-            wrong_requests += 1
-    print(f'Found {wrong_requests} request(s) of an inappropirate form!')
+            obj = None
+        if obj is None:
+            stats['wrong_requests'] += 1
+        else:
+            yield obj
+
+
+def convert_file(file):
+    stats = new_stats()
+    res = list(iter_logs(file, stats))
+    print_wrong_requests(stats)
+    return res
+
+
+def convert_file_columnar(file):
+    stats = new_stats()
+    res = LogColumns()
+    for log in iter_logs(file, stats):
+        res.append(log)
+    print_wrong_requests(stats)
     return res
 
 
+# Decodes raw 'dd/Mon/yyyy:HH:MM:SS +hhmm' bytes into the epoch seconds and
+# the datetime fields, the midnight of every day and offset is computed once.
+# None means the timestamp is not in that layout and needs the full parser
+def get_clf_fields(raw):
+    if len(raw) != 26 or raw[11:12] != b':' or raw[14:15] != b':' or raw[17:18] != b':' \
+            or not raw[12:20].replace(b':', b'').isdigit() \
+            or raw[12:14] > b'23' or raw[15:17] > b'59' or raw[18:20] > b'59':
+        return None
+    key = raw[:11] + raw[20:]
+    day = _day_epoch_cache.get(key)
+    if day is None:
+        try:
+            midnight = parse_clf_timestamp((raw[:11] + b':00:00:00' + raw[20:]).decode('ascii'))
+        except (KeyError, ValueError, UnicodeDecodeError):
+            return None
+        day = (int(midnight.timestamp()), midnight.year, midnight.month, midnight.day,
+               midnight.tzinfo)
+        if len(_day_epoch_cache) >= CACHE_LIMIT:
+            _day_epoch_cache.clear()
+        _day_epoch_cache[key] = day
+    hour, minute, second = int(raw[12:14]), int(raw[15:17]), int(raw[18:20])
+    return day[0] + hour * 3600 + minute * 60 + second, day, hour, minute, second
+
+
+# Runs the bytes version of the line pattern straight over the mapped file,
+# compares the epoch from the raw timestamp with the range and builds the
+# datetime and the remaining fields only for the entries inside it
+def iter_mmap_logs(path, start_time, finish_time, stats):
+    start_epoch, finish_epoch = start_time.timestamp(), finish_time.timestamp()
+    with open(path, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            return
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            pos, size = 0, len(buffer)
+            while pos < size:
+                end = buffer.find(b'\n', pos)
+                end = size if end == -1 else end + 1
+                match = log_line_bytes_pattern.match(buffer, pos, end)
+                pos = end
+                if match is None:
+                    stats['wrong_requests'] += 1
+                    continue
+                ip, raw, method, path, status_code, size_field = match.groups()
+                if method not in accepted_bytes_methods:
+                    stats['wrong_requests'] += 1
+                    continue
+                fields = get_clf_fields(raw)
+                if fields is None:
+                    timestamp = get_datetime_obj(raw.decode('utf-8'))
+                    if not start_time <= timestamp <= finish_time:
+                        continue
+                else:
+                    epoch, day, hour, minute, second = fields
+                    if not start_epoch <= epoch <= finish_epoch:
+                        continue
+                    timestamp = datetime(day[1], day[2], day[3], hour, minute, second,
+                                         tzinfo=day[4])
+                yield LogEntry(ip.decode('ascii'), timestamp,
+                               (method.decode('ascii'), path.decode('utf-8'),
+                                status_code.decode('ascii'), int(size_field)))
+
+
+def stream_mmap_logs(path, start_time, finish_time):
+    stats = new_stats()
+    print_logs(iter_mmap_logs(path, start_time, finish_time, stats),
+               start_time, finish_time)
+    print_wrong_requests(stats)
+
+
+def new_stats():
+    return {'wrong_requests': 0}
+
+
+def print_wrong_requests(stats):
+    print(
+        f'Found {stats["wrong_requests"]} request(s) of an inappropirate form!')
+
+
 def get_datetime_obj(arg):
-    return datetime.strptime(arg, '%d/%b/%Y:%H:%M:%S %z')
+    try:
+        return parse_clf_timestamp(arg)
+    except (KeyError, ValueError):
+        return datetime.strptime(arg, CLF_TIME_FORMAT)
+
+
+# Decodes the fixed 'dd/Mon/yyyy:HH:MM:SS +hhmm' layout directly, anything
+# else is left for strptime to deal with. int() alone would also take signs,
+# spaces and underscores, so the digits are checked first
+def parse_clf_timestamp(arg):
+    if len(arg) != 26 or not arg.isascii() or arg[2] != '/' or arg[6] != '/' \
+            or arg[11] != ':' or arg[14] != ':' or arg[17] != ':' or arg[20] != ' ':
+        raise ValueError('Not a CLF timestamp: %s' % arg)
+    date = _date_cache.get(arg[:11])
+    if date is None:
+        if not (arg[:2].isdigit() and arg[7:11].isdigit()):
+            raise ValueError('Not a CLF timestamp: %s' % arg)
+        date = (int(arg[7:11]), MONTHS[arg[3:6]], int(arg[:2]))
+        if len(_date_cache) >= CACHE_LIMIT:
+            _date_cache.clear()
+        _date_cache[arg[:11]] = date
+    tz = _tz_cache.get(arg[21:])
+    if tz is None:
+        tz = get_timezone(arg[21:])
+        if len(_tz_cache) >= CACHE_LIMIT:
+            _tz_cache.clear()
+        _tz_cache[arg[21:]] = tz
+    if not arg[12:20].replace(':', '').isdigit():
+        raise ValueError('Not a CLF timestamp: %s' % arg)
+    return datetime(date[0], date[1], date[2], int(arg[12:14]), int(arg[15:17]),
+                    int(arg[18:20]), tzinfo=tz)
+
+
+def get_timezone(offset):
+    if offset[0] not in '+-' or not offset[1:].isdigit() or offset[3] > '5':
+        raise ValueError('Not a UTC offset: %s' % offset)
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+    return timezone(-delta if offset[0] == '-' else delta)
+
+
+def filter_logs(logs, start_time, finish_time):
+    for log in logs:
+        if log is not None and start_time <= log.timestamp <= finish_time:
+            yield log
 
 
 def print_logs(arr, start_time, finish_time):
     print('Logs between dates:')
     if finish_time < start_time:
-        sys.stderr.print("Finish date cannot be earlier than the start!")
+        sys.stderr.write("Finish date cannot be earlier than the start!\n")
     else:
-        for log in arr:
-            if log is not None:
-                tmp = log.timestamp
-                if start_time <= tmp <= finish_time:
-                    print(log)
+        for log in filter_logs(arr, start_time, finish_time):
+            print(log)
+
+
+def stream_logs(file, start_time, finish_time):
+    stats = new_stats()
+    print_logs(iter_logs(file, stats), start_time, finish_time)
+    print_wrong_requests(stats)
+
+
+def get_line_epoch(line):
+    match = timestamp_pattern.search(line)
+    if match is None:
+        return None
+    try:
+        return int(get_datetime_obj(match.group(1).decode('ascii')).timestamp())
+    except ValueError:
+        return None
+
+
+# Every `step` lines the offset is sampled together with the latest timestamp
+# seen before it and the earliest one at or after it, so slightly unordered
+# logs still give safe bounds for seeking
+def build_time_index(path, step=INDEX_STEP):
+    offsets, prefix_max, suffix_min = [], [], []
+    latest = None
+    pos = 0
+    with open(path, 'rb') as source:
+        for n, line in enumerate(source):
+            if n % step == 0:
+                offsets.append(pos)
+                prefix_max.append(latest)
+                suffix_min.append(None)
+            epoch = get_line_epoch(line)
+            if epoch is not None:
+                if latest is None or epoch > latest:
+                    latest = epoch
+                if suffix_min[-1] is None or epoch < suffix_min[-1]:
+                    suffix_min[-1] = epoch
+            pos += len(line)
+    earliest = None
+    for i in reversed(range(len(suffix_min))):
+        if earliest is None or (suffix_min[i] is not None and suffix_min[i] < earliest):
+            earliest = suffix_min[i]
+        suffix_min[i] = earliest
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'step': step,
+            'offsets': offsets, 'prefix_max': prefix_max, 'suffix_min': suffix_min}
+
+
+def index_is_fresh(index, path, step):
+    stat = os.stat(path)
+    return index.get('size') == stat.st_size and index.get('mtime') == stat.st_mtime \
+        and index.get('step') == step
+
+
+def load_time_index(path, step=INDEX_STEP):
+    index_path = path + INDEX_SUFFIX
+    try:
+        with open(index_path, encoding='utf-8') as stream:
+            index = json.load(stream)
+        if index_is_fresh(index, path, step):
+            return index
+    except (OSError, ValueError):
+        pass
+    index = build_time_index(path, step)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as stream:
+        json.dump(index, stream)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def get_index_range(index, start_time, finish_time):
+    start, finish = start_time.timestamp(), finish_time.timestamp()
+    prefix_max = [float('-inf') if v is None else v for v in index['prefix_max']]
+    suffix_min = [float('inf') if v is None else v for v in index['suffix_min']]
+    offsets = index['offsets']
+    first = max(bisect_left(prefix_max, start) - 1, 0)
+    last = bisect_right(suffix_min, finish)
+    start_offset = offsets[first] if offsets else 0
+    stop_offset = offsets[last] if last < len(offsets) else index['size']
+    return start_offset, stop_offset
+
+
+def read_byte_range(path, start_offset, stop_offset):
+    with open(path, 'rb') as source:
+        source.seek(start_offset)
+        pos = start_offset
+        while pos < stop_offset:
+            line = source.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode('utf-8')
+
+
+def stream_indexed_logs(path, start_time, finish_time, step=INDEX_STEP):
+    index = load_time_index(path, step)
+    start_offset, stop_offset = get_index_range(index, start_time, finish_time)
+    stream_logs(read_byte_range(path, start_offset, stop_offset),
+                start_time, finish_time)
+
+
+def split_file(path, chunk_size=CHUNK_SIZE):
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as source:
+        while start < size:
+            source.seek(min(start + chunk_size, size))
+            source.readline()
+            end = source.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_chunk(path, byte_range):
+    stats = new_stats()
+    logs = list(iter_logs(read_byte_range(path, *byte_range), stats))
+    return logs, stats
+
+
+def iter_logs_parallel(path, stats, workers=None, chunk_size=CHUNK_SIZE):
+    ranges = split_file(path, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for logs, chunk_stats in executor.map(parse_chunk, [path] * len(ranges), ranges):
+            for key, value in chunk_stats.items():
+                stats[key] += value
+            yield from logs
+
+
+def convert_file_parallel(path, workers=None, chunk_size=CHUNK_SIZE):
+    stats = new_stats()
+    res = list(iter_logs_parallel(path, stats, workers, chunk_size))
+    print_wrong_requests(stats)
+    return res
+
+
+def new_totals():
+    return {'entries': 0, 'wrong_requests': 0, 'bytes': 0, 'status_codes': {}}
+
+
+def update_totals(totals, log):
+    totals['entries'] += 1
+    totals['bytes'] += log.request.size
+    codes = totals['status_codes']
+    codes[log.request.status_code] = codes.get(log.request.status_code, 0) + 1
+
+
+def print_totals(totals):
+    print('Totals since the first checkpoint:')
+    print(f'Entries: {totals["entries"]}')
+    print(f'Wrong requests: {totals["wrong_requests"]}')
+    print(f'Bytes sent: {totals["bytes"]}')
+    for code, count in sorted(totals['status_codes'].items()):
+        print(f'Status {code}: {count}')
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {'inode': None, 'offset': 0, 'totals': new_totals()}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as stream:
+        json.dump(checkpoint, stream)
+    os.replace(tmp_path, path)
+
+
+# Only complete lines are consumed, a line still being written is picked up
+# on the next poll
+def iter_new_lines(source, checkpoint):
+    source.seek(checkpoint['offset'])
+    for line in source:
+        if not line.endswith(b'\n'):
+            break
+        checkpoint['offset'] += len(line)
+        yield line.decode('utf-8')
+
+
+def iter_rotated_lines(path, checkpoint):
+    rotated = path + '.1'
+    if os.path.exists(rotated) and os.stat(rotated).st_ino == checkpoint['inode']:
+        with open(rotated, 'rb') as source:
+            yield from iter_new_lines(source, checkpoint)
+
+
+# With missing_ok a log that is not there, like between the rename and the
+# create of a rotation, just has nothing new beyond what is left in .1
+def iter_checkpointed_lines(path, checkpoint, missing_ok=False):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        if not missing_ok:
+            raise
+        if checkpoint['inode'] is not None:
+            yield from iter_rotated_lines(path, checkpoint)
+        return
+    if checkpoint['inode'] is not None and checkpoint['inode'] != stat.st_ino:
+        yield from iter_rotated_lines(path, checkpoint)
+        checkpoint['offset'] = 0
+    elif stat.st_size < checkpoint['offset']:
+        checkpoint['offset'] = 0
+    checkpoint['inode'] = stat.st_ino
+    with open(path, 'rb') as source:
+        yield from iter_new_lines(source, checkpoint)
+
+
+def process_new_logs(path, checkpoint, start_time, finish_time, missing_ok=False):
+    totals = checkpoint['totals']
+    stats = new_stats()
+    for log in iter_logs(iter_checkpointed_lines(path, checkpoint, missing_ok), stats):
+        update_totals(totals, log)
+        if start_time <= log.timestamp <= finish_time:
+            print(log)
+    totals['wrong_requests'] += stats['wrong_requests']
+
+
+def follow_logs(path, start_time, finish_time, checkpoint_path=None,
+                follow=False, interval=FOLLOW_INTERVAL):
+    checkpoint_path = checkpoint_path or path + CHECKPOINT_SUFFIX
+    checkpoint = load_checkpoint(checkpoint_path)
+    print('Logs between dates:')
+    try:
+        while True:
+            process_new_logs(path, checkpoint, start_time, finish_time, follow)
+            save_checkpoint(checkpoint_path, checkpoint)
+            if not follow:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        save_checkpoint(checkpoint_path, checkpoint)
+    print_totals(checkpoint['totals'])
+
+
+class ExactCounter:
+    def __init__(self, size=None):
+        self.counts = Counter()
+
+    def update(self, key, weight=1):
+        self.counts[key] += weight
+
+    def top(self, n):
+        return self.counts.most_common(n)
+
+
+# Space-Saving: keeps at most `size` keys, a new key takes over the smallest
+# counter and inherits its count as the possible overestimation
+class SpaceSavingCounter:
+    def __init__(self, size=SKETCH_SIZE):
+        self.size = size
+        self.counts = {}
+        self.heap = []
+
+    def update(self, key, weight=1):
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.size:
+            self.counts[key] = weight
+        else:
+            smallest = self._pop_smallest()
+            self.counts[key] = self.counts.pop(smallest) + weight
+        heapq.heappush(self.heap, (self.counts[key], key))
+        if len(self.heap) > 4 * self.size:
+            self.heap = [(count, k) for k, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_smallest(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return key
+
+    def top(self, n):
+        return heapq.nlargest(n, self.counts.items(), key=lambda kv: kv[1])
+
+
+# Count-min sketch estimates every key, only the current leaders are kept
+# by name
+class CountMinCounter:
+    def __init__(self, size=SKETCH_SIZE, depth=SKETCH_DEPTH):
+        self.width = size * 4
+        self.rows = [array('Q', bytes(8 * self.width)) for _ in range(depth)]
+        self.size = size
+        self.leaders = {}
+        self.floor = 0
+
+    def update(self, key, weight=1):
+        estimate = None
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest()
+        first, second = int.from_bytes(digest[:4], 'big'), int.from_bytes(digest[4:], 'big')
+        for i, row in enumerate(self.rows):
+            cell = (first + i * second) % self.width
+            row[cell] += weight
+            if estimate is None or row[cell] < estimate:
+                estimate = row[cell]
+        if key in self.leaders or len(self.leaders) < self.size:
+            self.leaders[key] = estimate
+        elif estimate > self.floor:
+            smallest = min(self.leaders, key=self.leaders.get)
+            self.floor = self.leaders[smallest]
+            if estimate > self.floor:
+                del self.leaders[smallest]
+                self.leaders[key] = estimate
+                self.floor = min(self.leaders.values())
+
+    def top(self, n):
+        return heapq.nlargest(n, self.leaders.items(), key=lambda kv: kv[1])
+
+
+TOP_COUNTERS = {
+    'exact': ExactCounter,
+    'space-saving': SpaceSavingCounter,
+    'count-min': CountMinCounter,
+}
+
+
+def build_top_report(logs, mode='space-saving', size=SKETCH_SIZE):
+    report = {(dimension, metric): TOP_COUNTERS[mode](size)
+              for dimension in REPORT_DIMENSIONS for metric in REPORT_METRICS}
+    for log in logs:
+        for (dimension, metric), counter in report.items():
+            counter.update(REPORT_DIMENSIONS[dimension](log),
+                           REPORT_METRICS[metric](log))
+    return report
+
+
+def print_top_report(report, n=TOP_N):
+    for (dimension, metric), counter in report.items():
+        print(f'Top {n} {dimension} by {metric}:')
+        for place, (key, value) in enumerate(counter.top(n), 1):
+            print(f'#{place} - {key}: {value}')
+
+
+def stream_top_report(file, n=TOP_N, mode='space-saving', size=SKETCH_SIZE):
+    stats = new_stats()
+    print_top_report(build_top_report(iter_logs(file, stats), mode, size), n)
+    print_wrong_requests(stats)
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in COMPRESSED_OPENERS
+
+
+def open_log(path):
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(path)[1])
+    if opener is None:
+        return open(path, 'r', encoding='utf-8', buffering=READ_BUFFER)
+    return io.TextIOWrapper(io.BufferedReader(opener(path, 'rb'), READ_BUFFER),
+                            encoding='utf-8')
+
+
+def get_first_timestamp(path):
+    with open_log(path) as source:
+        for line in source:
+            match = log_line_pattern.match(line)
+            if match is not None:
+                try:
+                    return get_datetime_obj(match.group(2))
+                except ValueError:
+                    pass
+    return None
+
+
+# Globs are expanded and the rotation set is put in the order of the first
+# timestamp found in every file, files without one go last
+def expand_log_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in paths:
+                paths.append(path)
+    if len(paths) < 2:
+        return paths
+    first_timestamps = {path: get_first_timestamp(path) for path in paths}
+    return sorted(paths, key=lambda p: (first_timestamps[p] is None,
+                                        first_timestamps[p].timestamp() if first_timestamps[p] else 0))
+
+
+def iter_log_lines(paths):
+    for path in paths:
+        with open_log(path) as source:
+            yield from source
+
+
+def parse_log_file(path):
+    stats = new_stats()
+    with open_log(path) as source:
+        logs = list(iter_logs(source, stats))
+    return logs, stats
+
+
+def convert_files_parallel(paths, workers=None):
+    stats = new_stats()
+    res = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for logs, file_stats in executor.map(parse_log_file, paths):
+            stats['wrong_requests'] += file_stats['wrong_requests']
+            res.extend(logs)
+    print_wrong_requests(stats)
+    return res
+
+
+def new_ring(size):
+    return array('Q', bytes(8 * size))
+
+
+# Fixed number of buckets kept in a ring, which also absorbs slightly
+# unordered lines: a bucket is only emitted once it falls out of the ring
+class RateSeries:
+    def __init__(self, width=1, capacity=RING_SIZE):
+        self.width = width
+        self.capacity = capacity
+        self.requests = new_ring(capacity)
+        self.bytes = new_ring(capacity)
+        self.errors = new_ring(capacity)
+        self.head = None
+        self.late = 0
+
+    def add(self, epoch, size, error):
+        bucket = epoch // self.width
+        closed = []
+        if self.head is None:
+            self.head = bucket
+        elif bucket > self.head:
+            closed = self._evict(self.head - self.capacity + 1,
+                                 min(bucket, self.head + self.capacity) - self.capacity + 1)
+            self.head = bucket
+        elif bucket <= self.head - self.capacity:
+            self.late += 1
+            return closed
+        slot = bucket % self.capacity
+        self.requests[slot] += 1
+        self.bytes[slot] += size
+        self.errors[slot] += error
+        return closed
+
+    def flush(self):
+        if self.head is None:
+            return []
+        closed = self._evict(self.head - self.capacity + 1, self.head + 1)
+        self.head = None
+        return closed
+
+    def _evict(self, first, stop):
+        closed = []
+        for bucket in range(first, stop):
+            slot = bucket % self.capacity
+            if self.requests[slot]:
+                closed.append((bucket * self.width, self.requests[slot],
+                               self.bytes[slot], self.errors[slot]))
+            self.requests[slot] = self.bytes[slot] = self.errors[slot] = 0
+        return closed
+
+
+# Per-second ring holding the sliding window and the trailing baseline right
+# before it, both sums are updated in O(1) for every second pushed
+class SpikeDetector:
+    def __init__(self, window=SPIKE_WINDOW, baseline=SPIKE_BASELINE,
+                 factor=SPIKE_FACTOR, min_requests=SPIKE_MIN_REQUESTS):
+        self.window = window
+        self.size = window + baseline
+        self.factor = factor
+        self.min_requests = min_requests
+        self.requests = new_ring(self.size)
+        self.errors = new_ring(self.size)
+        self.window_sums = [0, 0]
+        self.baseline_sums = [0, 0]
+        self.second = None
+        self.in_spike = False
+
+    def push(self, second, requests, errors):
+        events = []
+        if self.second is not None:
+            # Once size empty seconds are pushed the ring holds only zeros and
+            # the rest of a longer gap cannot change anything
+            for empty in range(self.second + 1, min(second, self.second + 1 + self.size)):
+                events.extend(self._push_one(empty, 0, 0))
+        events.extend(self._push_one(second, requests, errors))
+        return events
+
+    def _push_one(self, second, requests, errors):
+        slot = second % self.size
+        moving = (second - self.window) % self.size
+        self.baseline_sums[0] -= self.requests[slot]
+        self.baseline_sums[1] -= self.errors[slot]
+        self.window_sums[0] -= self.requests[moving]
+        self.window_sums[1] -= self.errors[moving]
+        self.baseline_sums[0] += self.requests[moving]
+        self.baseline_sums[1] += self.errors[moving]
+        self.requests[slot] = requests
+        self.errors[slot] = errors
+        self.window_sums[0] += requests
+        self.window_sums[1] += errors
+        self.second = second
+        window_rate = self.window_sums[1] / self.window_sums[0] if self.window_sums[0] else 0
+        baseline_rate = self.baseline_sums[1] / self.baseline_sums[0] if self.baseline_sums[0] else 0
+        spike = self.window_sums[0] >= self.min_requests and self.window_sums[1] > 0 \
+            and self.baseline_sums[0] >= self.min_requests and window_rate > self.factor * baseline_rate
+        if spike == self.in_spike:
+            return []
+        self.in_spike = spike
+        return [(second, spike, window_rate, baseline_rate)]
+
+
+def format_epoch(epoch, tz):
+    return str(datetime.fromtimestamp(epoch, tz))
+
+
+def print_buckets(buckets, tz):
+    for start, requests, size, errors in buckets:
+        print(f'{format_epoch(start, tz)} - requests: {requests}, bytes: {size}, '
+              f'5xx rate: {errors / requests:.3f}')
+
+
+def print_spikes(events, tz):
+    for second, spike, window_rate, baseline_rate in events:
+        if spike:
+            print(f'Spike started at {format_epoch(second, tz)}: 5xx rate {window_rate:.3f} '
+                  f'vs baseline {baseline_rate:.3f}')
+        else:
+            print(f'Spike ended at {format_epoch(second, tz)}')
+
+
+def stream_rate_report(file, width=None, detector=None):
+    stats = new_stats()
+    series = RateSeries(width) if width else None
+    seconds = RateSeries(1) if detector else None
+    tz = None
+    for log in iter_logs(file, stats):
+        epoch = int(log.timestamp.timestamp())
+        error = int(log.request.status_code[0] == '5')
+        tz = tz or log.timestamp.tzinfo
+        if series:
+            print_buckets(series.add(epoch, log.request.size, error), tz)
+        if seconds:
+            for second, requests, _, errors in seconds.add(epoch, 0, error):
+                print_spikes(detector.push(second, requests, errors), tz)
+    if series:
+        print_buckets(series.flush(), tz)
+    if seconds:
+        for second, requests, _, errors in seconds.flush():
+            print_spikes(detector.push(second, requests, errors), tz)
+    print_wrong_requests(stats)
+    for name, rates in (('rate', series), ('spike', seconds)):
+        if rates:
+            print(f'Skipped {rates.late} line(s) too late for the {name} buckets!')
+
+
+def get_log_fingerprint(path, offset):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as source:
+        digest.update(source.read(min(offset, CACHE_FINGERPRINT_SIZE)))
+        source.seek(max(offset - CACHE_FINGERPRINT_SIZE, 0))
+        digest.update(source.read(min(offset, CACHE_FINGERPRINT_SIZE)))
+    return digest.hexdigest()
+
+
+# Layout: magic, header length, JSON header with the string tables, then
+# every column as raw machine values aligned to 8 bytes
+def save_columns_cache(cache_path, columns, meta):
+    header = dict(meta, version=CACHE_VERSION, rows=len(columns), methods=columns.methods,
+                  paths=columns.paths, odd_ips={str(k): v for k, v in columns.odd_ips.items()})
+    encoded = json.dumps(header).encode('utf-8')
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(CACHE_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for name, _ in LogColumns.COLUMNS:
+            out.write(bytes(-out.tell() % 8))
+            out.write(memoryview(getattr(columns, name)).cast('B'))
+    os.replace(tmp_path, cache_path)
+
+
+def load_columns_cache(cache_path):
+    with open(cache_path, 'rb') as source:
+        if source.read(4) != CACHE_MAGIC:
+            raise ValueError('Not a log cache file')
+        header_length = struct.unpack('<I', source.read(4))[0]
+        header = json.loads(source.read(header_length))
+        if header.get('version') != CACHE_VERSION:
+            raise ValueError('Log cache was written by another parser version')
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    columns = LogColumns()
+    columns._buffer = buffer
+    view = memoryview(buffer)
+    pos = 8 + header_length
+    for name, typecode in LogColumns.COLUMNS:
+        pos += -pos % 8
+        length = header['rows'] * array(typecode).itemsize
+        setattr(columns, name, view[pos:pos + length].cast(typecode))
+        pos += length
+    columns.methods = header['methods']
+    columns.paths = header['paths']
+    columns.odd_ips = {int(k): v for k, v in header['odd_ips'].items()}
+    return columns, header
+
+
+# The cache is reused as long as the parser version matches and the log was
+# only appended to, in which case just the new tail is parsed. A last line
+# without a newline is cached too, but the next append parses it again from
+# the end of the complete lines; a log that was only touched keeps its rows
+def convert_file_cached(path, cache_path=None):
+    cache_path = cache_path or path + CACHE_SUFFIX
+    stat = os.stat(path)
+    try:
+        columns, header = load_columns_cache(cache_path)
+        if header['size'] == stat.st_size and header['mtime'] == stat.st_mtime:
+            print_wrong_requests(header)
+            return columns
+        if stat.st_size < header['offset'] or \
+                get_log_fingerprint(path, header['offset']) != header['fingerprint']:
+            raise ValueError('Log file was changed, not appended')
+        if header['size'] == stat.st_size:
+            save_columns_cache(cache_path, columns, dict(header, mtime=stat.st_mtime))
+            print_wrong_requests(header)
+            return columns
+        columns.make_writable(header['complete_rows'])
+        checkpoint = {'offset': header['offset']}
+        stats = {'wrong_requests': header['complete_wrong_requests']}
+    except (OSError, ValueError, KeyError):
+        columns = LogColumns()
+        checkpoint = {'offset': 0}
+        stats = new_stats()
+    with open(path, 'rb') as source:
+        for log in iter_logs(iter_new_lines(source, checkpoint), stats):
+            columns.append(log)
+        complete_rows, complete_wrong_requests = len(columns), stats['wrong_requests']
+        source.seek(checkpoint['offset'])
+        tail = source.read()
+    for log in iter_logs(tail.decode('utf-8').splitlines(), stats):
+        columns.append(log)
+    save_columns_cache(cache_path, columns, {
+        'size': checkpoint['offset'] + len(tail), 'mtime': stat.st_mtime,
+        'offset': checkpoint['offset'], 'complete_rows': complete_rows,
+        'complete_wrong_requests': complete_wrong_requests,
+        'fingerprint': get_log_fingerprint(path, checkpoint['offset']),
+        'wrong_requests': stats['wrong_requests']})
+    print_wrong_requests(stats)
+    return columns
+
+
+def positive_int(value):
+    number = int(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'must be a positive integer: {value}')
+    return number
+
+
+def clf_timestamp(value):
+    try:
+        return get_datetime_obj(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'must be a CLF timestamp like 18/Oct/2020:10:59:54 +0200: {value}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Analyzes a web server access log')
+    parser.add_argument('logfiles', nargs='*', default=['./access_log.txt'],
+                        help='log files or globs to analyze, plain or gz/bz2/xz compressed')
+    parser.add_argument('--start', type=clf_timestamp, default='18/Oct/2020:10:59:54 +0200',
+                        help='start of the time range (CLF timestamp)')
+    parser.add_argument('--end', type=clf_timestamp, default='18/Oct/2020:15:02:29 +0200',
+                        help='end of the time range (CLF timestamp)')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='parse, filter and print lazily in constant memory')
+    parser.add_argument('-i', '--index', action='store_true',
+                        help='seek to the time range using a sidecar byte-offset index')
+    parser.add_argument('--index-step', type=positive_int, default=INDEX_STEP,
+                        help='number of lines between two sampled index offsets')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='process only lines added since the saved checkpoint')
+    parser.add_argument('--checkpoint-file',
+                        help='where the checkpoint is kept (default: <logfile>.checkpoint)')
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help='keep tailing the log, saving a checkpoint after every poll')
+    parser.add_argument('--interval', type=float, default=FOLLOW_INTERVAL,
+                        help='seconds between two polls in follow mode')
+    parser.add_argument('-t', '--top', type=int, metavar='N',
+                        help='report the top N paths, client IPs and status codes')
+    parser.add_argument('--top-mode', choices=TOP_COUNTERS, default='space-saving',
+                        help='counting method used for the top report')
+    parser.add_argument('--sketch-size', type=positive_int, default=SKETCH_SIZE,
+                        help='number of keys tracked by a heavy-hitter sketch')
+    parser.add_argument('-r', '--rates', choices=RATE_WIDTHS,
+                        help='print request, byte and 5xx rate series per second or minute')
+    parser.add_argument('--spikes', action='store_true',
+                        help='detect 5xx rate spikes over a sliding window')
+    parser.add_argument('--spike-window', type=positive_int, default=SPIKE_WINDOW,
+                        help='length of the sliding window in seconds')
+    parser.add_argument('--spike-baseline', type=positive_int, default=SPIKE_BASELINE,
+                        help='length of the trailing baseline in seconds')
+    parser.add_argument('--spike-factor', type=float, default=SPIKE_FACTOR,
+                        help='how many times the baseline 5xx rate counts as a spike')
+    parser.add_argument('--spike-min-requests', type=int, default=SPIKE_MIN_REQUESTS,
+                        help='requests needed in the window before it is judged')
+    parser.add_argument('--cache', action='store_true',
+                        help='load parsed entries from a binary cache kept next to the log')
+    parser.add_argument('-m', '--mmap', action='store_true',
+                        help='memory-map the log and decode only the matching entries')
+    parser.add_argument('-c', '--columnar', action='store_true',
+                        help='keep parsed entries in a compact columnar store')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='parse the log in parallel using this many processes')
+    parser.add_argument('--chunk-size', type=positive_int, default=CHUNK_SIZE,
+                        help='size in bytes of a chunk handed to a worker')
+    parser.add_argument('-d', '--decompress-workers', type=int,
+                        help='decompress and parse whole files in this many processes')
+    return parser.parse_args()
 
 
 def run():
+    args = parse_args()
     try:
-        source = open("./access_log.txt", "r", encoding='utf-8')
-        start_time = get_datetime_obj('18/Oct/2020:10:59:54 +0200')
-        end_time = get_datetime_obj('18/Oct/2020:15:02:29 +0200')
-        print_logs(convert_file(source), start_time, end_time)
+        start_time, end_time = args.start, args.end
+        paths = expand_log_paths(args.logfiles)
+        if args.index or args.follow or args.checkpoint or args.mmap or args.workers \
+                or args.cache:
+            if len(paths) != 1 or is_compressed(paths[0]):
+                sys.stderr.write('This mode works on a single uncompressed log file!')
+                return
+            logfile = paths[0]
+        if args.index:
+            stream_indexed_logs(logfile, start_time, end_time,
+                                args.index_step)
+            return
+        if args.follow or args.checkpoint:
+            follow_logs(logfile, start_time, end_time, args.checkpoint_file,
+                        args.follow, args.interval)
+            return
+        if args.cache:
+            print_logs(convert_file_cached(logfile), start_time, end_time)
+            return
+        if args.mmap:
+            stream_mmap_logs(logfile, start_time, end_time)
+            return
+        if args.workers:
+            print_logs(convert_file_parallel(logfile, args.workers, args.chunk_size),
+                       start_time, end_time)
+            return
+        if args.decompress_workers:
+            print_logs(convert_files_parallel(paths, args.decompress_workers),
+                       start_time, end_time)
+            return
+        source = iter_log_lines(paths)
+        if args.rates or args.spikes:
+            detector = SpikeDetector(args.spike_window, args.spike_baseline, args.spike_factor,
+                                     args.spike_min_requests) if args.spikes else None
+            stream_rate_report(source, RATE_WIDTHS.get(args.rates), detector)
+        elif args.top:
+            stream_top_report(source, args.top, args.top_mode, args.sketch_size)
+        elif args.stream:
+            stream_logs(source, start_time, end_time)
+        elif args.columnar:
+            print_logs(convert_file_columnar(source), start_time, end_time)
+        else:
+            print_logs(convert_file(source), start_time, end_time)
     except EnvironmentError:
         sys.stderr.write(
             'File with the specified name cannot be opened / found !')
@@ -0,0 +1,295 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+
+import analyzer
+
+SAMPLE_LOG = './access_log.txt'
+BENCH_LINES = 10 ** 5
+MALFORMED_RATIO = 0.05
+REGRESSION_THRESHOLD = 0.1
+WRITE_BUFFER = 1024 * 1024
+MONTH_NAMES = {v: k for k, v in analyzer.MONTHS.items()}
+sample_line_pattern = re.compile(
+    r'^(\S+) (\S+ \S+) \[([^\]]+)\] ("[^"]*") (\S+) (\S+)(.*)$')
+
+
+class LogShape:
+    def __init__(self):
+        self.ips = []
+        self.requests = []
+        self.statuses = []
+        self.sizes = []
+        self.tails = []
+        self.malformed = []
+        self.start = None
+        self.gaps = []
+
+
+def learn_shape(path):
+    shape = LogShape()
+    previous = None
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            line = line.rstrip('\n')
+            match = sample_line_pattern.match(line)
+            try:
+                valid = analyzer.convert_line(line) is not None
+            except analyzer.MalformedHTTPRequest:
+                valid = False
+            if not valid or match is None:
+                shape.malformed.append(line)
+                continue
+            shape.ips.append(match.group(1))
+            shape.requests.append(match.group(4))
+            shape.statuses.append(match.group(5))
+            shape.sizes.append(match.group(6))
+            shape.tails.append(match.group(7))
+            timestamp = analyzer.get_datetime_obj(match.group(3))
+            if previous is None:
+                shape.start = timestamp
+            else:
+                shape.gaps.append(max(int((timestamp - previous).total_seconds()), 0))
+            previous = timestamp
+    if shape.start is None:
+        raise ValueError('No well-formed lines found in the sample log')
+    return shape
+
+
+def format_clf_timestamp(value):
+    offset = int(value.utcoffset().total_seconds()) // 60
+    sign = '-' if offset < 0 else '+'
+    return '%02d/%s/%04d:%02d:%02d:%02d %s%02d%02d' % (
+        value.day, MONTH_NAMES[value.month], value.year, value.hour, value.minute,
+        value.second, sign, abs(offset) // 60, abs(offset) % 60)
+
+
+def generate_log(shape, out_path, lines, malformed_ratio=MALFORMED_RATIO, seed=0):
+    rnd = random.Random(seed)
+    gaps = shape.gaps or [1]
+    current = shape.start
+    stamp = format_clf_timestamp(current)
+    with open(out_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER) as out:
+        for _ in range(lines):
+            gap = rnd.choice(gaps)
+            if gap:
+                current += timedelta(seconds=gap)
+                stamp = format_clf_timestamp(current)
+            if shape.malformed and rnd.random() < malformed_ratio:
+                out.write(rnd.choice(shape.malformed))
+                out.write('\n')
+                continue
+            out.write('%s - - [%s] %s %s %s%s\n' % (
+                rnd.choice(shape.ips), stamp, rnd.choice(shape.requests),
+                rnd.choice(shape.statuses), rnd.choice(shape.sizes), rnd.choice(shape.tails)))
+
+
+def scenario_parse(path):
+    stats = analyzer.new_stats()
+    with open(path, encoding='utf-8') as source:
+        for _ in analyzer.iter_logs(source, stats):
+            pass
+
+
+def scenario_filter(path):
+    stats = analyzer.new_stats()
+    with open(path, encoding='utf-8') as source:
+        logs = analyzer.iter_logs(source, stats)
+        first = next(logs)
+        finish = first.timestamp + timedelta(hours=12)
+        for _ in analyzer.filter_logs(logs, first.timestamp, finish):
+            pass
+
+
+def scenario_convert(path):
+    with open(path, encoding='utf-8') as source:
+        analyzer.convert_file(source)
+
+
+def scenario_mmap(path):
+    stats = analyzer.new_stats()
+    start = analyzer.get_datetime_obj('01/Jan/1970:00:00:00 +0000')
+    finish = analyzer.get_datetime_obj('31/Dec/9999:23:59:59 +0000')
+    for _ in analyzer.iter_mmap_logs(path, start, finish, stats):
+        pass
+
+
+def scenario_top_exact(path):
+    stats = analyzer.new_stats()
+    with open(path, encoding='utf-8') as source:
+        analyzer.build_top_report(analyzer.iter_logs(source, stats), 'exact')
+
+
+def scenario_top_sketch(path):
+    stats = analyzer.new_stats()
+    with open(path, encoding='utf-8') as source:
+        analyzer.build_top_report(analyzer.iter_logs(source, stats), 'space-saving')
+
+
+SCENARIOS = {
+    'parse': scenario_parse,
+    'filter': scenario_filter,
+    'convert': scenario_convert,
+    'mmap': scenario_mmap,
+    'aggregate-exact': scenario_top_exact,
+    'aggregate-sketch': scenario_top_sketch,
+}
+
+
+def measure(name, path):
+    devnull = open(os.devnull, 'w')
+    sys.stdout = devnull
+    try:
+        start = time.perf_counter()
+        SCENARIOS[name](path)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout = sys.__stdout__
+        devnull.close()
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# Every scenario runs in a fresh process so the peak RSS belongs to it alone
+def run_scenarios(path, names, lines):
+    results = {}
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            elapsed, peak_rss = executor.submit(measure, name, path).result()
+        results[name] = {'seconds': round(elapsed, 4),
+                         'lines_per_sec': round(lines / elapsed),
+                         'peak_rss_kb': peak_rss}
+        print(f'{name}: {elapsed:.3f}s, {lines / elapsed:,.0f} lines/s, '
+              f'peak RSS {peak_rss / 1024:.1f} MiB')
+    return results
+
+
+def compare_results(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path, encoding='utf-8') as stream:
+        baseline = json.load(stream)['results']
+    regressions = []
+    print(f'Compared with {baseline_path}:')
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['lines_per_sec'] / baseline[name]['lines_per_sec']
+        print(f'{name}: x{ratio:.2f} throughput')
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    if regressions:
+        print(f'Regressions found in: {", ".join(regressions)}')
+    return regressions
+
+
+def load_timestamps(path, scale):
+    with open(path, encoding='utf-8') as source:
+        stamps = [m.group(2) for m in map(analyzer.log_line_pattern.match, source)
+                  if m is not None]
+    return stamps * scale
+
+
+def time_it(func, args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def parse_with_strptime(stamps):
+    for s in stamps:
+        datetime.strptime(s, analyzer.CLF_TIME_FORMAT)
+
+
+def parse_with_fast_path(stamps):
+    for s in stamps:
+        analyzer.get_datetime_obj(s)
+
+
+def bench_timestamps(path, scale):
+    stamps = load_timestamps(path, scale)
+    slow = time_it(parse_with_strptime, (stamps,))
+    fast = time_it(parse_with_fast_path, (stamps,))
+    print(f'Timestamps parsed: {len(stamps)}')
+    print(f'strptime:  {slow:.3f}s ({len(stamps) / slow:,.0f}/s)')
+    print(f'fast path: {fast:.3f}s ({len(stamps) / fast:,.0f}/s)')
+    print(f'Speedup: x{slow / fast:.1f}')
+
+
+def cmd_generate(args):
+    generate_log(learn_shape(args.sample), args.output, args.lines,
+                 args.malformed_ratio, args.seed)
+
+
+def cmd_run(args):
+    names = args.scenarios or list(SCENARIOS)
+    if args.logfile:
+        path = args.logfile
+        with open(path, 'rb') as source:
+            lines = sum(1 for _ in source)
+    else:
+        fd, path = tempfile.mkstemp(suffix='.log')
+        os.close(fd)
+        lines = args.lines
+        generate_log(learn_shape(args.sample), path, lines,
+                     args.malformed_ratio, args.seed)
+    try:
+        results = run_scenarios(path, names, lines)
+    finally:
+        if not args.logfile:
+            os.remove(path)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump({'meta': {'lines': lines, 'python': platform.python_version(),
+                                'machine': platform.machine(),
+                                'created': datetime.now().isoformat(timespec='seconds')},
+                       'results': results}, stream, indent=2)
+    if args.compare and compare_results(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+def cmd_timestamps(args):
+    bench_timestamps(args.sample, args.scale)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the log analyzer')
+    parser.add_argument('--sample', default=SAMPLE_LOG,
+                        help='the log file used as a sample')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='write a synthetic log')
+    generate.add_argument('output', help='where the generated log is written')
+    run_cmd = commands.add_parser('run', help='time the analyzer scenarios')
+    run_cmd.add_argument('--logfile', help='use an existing log instead of a generated one')
+    run_cmd.add_argument('--scenarios', nargs='*', choices=SCENARIOS,
+                         help='scenarios to run (default: all)')
+    run_cmd.add_argument('-o', '--output', help='save the results as JSON')
+    run_cmd.add_argument('--compare', metavar='JSON',
+                         help='fail when throughput drops below a saved run')
+    run_cmd.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                         help='allowed relative throughput drop')
+    for command in (generate, run_cmd):
+        command.add_argument('-n', '--lines', type=int, default=BENCH_LINES,
+                             help='number of generated lines')
+        command.add_argument('--malformed-ratio', type=float, default=MALFORMED_RATIO,
+                             help='share of malformed lines in the generated log')
+        command.add_argument('--seed', type=int, default=0,
+                             help='seed of the random generator')
+    timestamps = commands.add_parser(
+        'timestamps', help='compare strptime with the fast timestamp parser')
+    timestamps.add_argument('--scale', type=int, default=100,
+                            help='how many times the sample is repeated')
+    args = parser.parse_args()
+    {'generate': cmd_generate, 'run': cmd_run, 'timestamps': cmd_timestamps}[args.command](args)
+
+
+if __name__ == '__main__':
+    run()